@@ -0,0 +1,48 @@
+"""
+Time getting and setting a scalar element of a wrapped derived type with
+wrappers built by ``f2py-f90wrap`` with and without ``--fast-accessors``,
+which leaves out the interrupt handler and ``setjmp`` trap in the
+generated accessor routines.
+
+Usage: python accessor_calls.py [n_calls]
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from common import build_module, run, temporary_directory
+
+# module and type names differ between builds, as f90wrap classes are
+# registered by name
+SOURCE = """
+module %(name)s_mod
+    implicit none
+    type %(name)s_type
+        integer :: n
+    end type %(name)s_type
+end module %(name)s_mod
+"""
+
+BUILDS = [('scalar_default', []),
+          ('scalar_fast', ['--fast-accessors'])]
+
+
+def main(n_calls=1000000):
+    with temporary_directory(importable=True) as tmpdir:
+        for name, options in BUILDS:
+            build_module(tmpdir, name, SOURCE % {'name': name}, f2py_args=options)
+        print('%-16s %12s %12s' % ('build', 'get/us', 'set/us'))
+        for name, options in BUILDS:
+            module = getattr(__import__(name), name + '_mod')
+            obj = getattr(module, name + '_type')()
+            get = min(timeit.repeat(lambda: obj.n, number=n_calls, repeat=3))
+
+            def set_n():
+                obj.n = 1
+            set = min(timeit.repeat(set_n, number=n_calls, repeat=3))
+            print('%-16s %12.3f %12.3f' % (name, get / n_calls * 1e6, set / n_calls * 1e6))
+
+
+if __name__ == '__main__':
+    run(main)
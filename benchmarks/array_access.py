@@ -0,0 +1,49 @@
+"""
+Time access to array members of a wrapped derived type, i.e. the latency
+of ``obj.array_member`` in Python for a fixed size and an allocatable
+array element.
+
+Usage: python array_access.py [n_calls]
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from common import build_module, run, temporary_directory
+
+SOURCE = """
+module access_mod
+    implicit none
+    type access_type
+        real(8) :: fixed(10)
+        real(8), allocatable :: alloc(:)
+    end type access_type
+contains
+    subroutine access_type_initialise(this)
+        type(access_type), intent(inout) :: this
+        this%fixed = 0.0
+        allocate(this%alloc(10))
+        this%alloc = 0.0
+    end subroutine access_type_initialise
+
+    subroutine access_type_finalise(this)
+        type(access_type), intent(inout) :: this
+        if (allocated(this%alloc)) deallocate(this%alloc)
+    end subroutine access_type_finalise
+end module access_mod
+"""
+
+
+def main(n_calls=100000):
+    with temporary_directory(importable=True) as tmpdir:
+        build_module(tmpdir, 'access', SOURCE)
+        import access
+        obj = access.access_mod.access_type()
+        for name in ('fixed', 'alloc'):
+            t = min(timeit.repeat(lambda: getattr(obj, name), number=n_calls, repeat=3))
+            print('obj.%-10s %8.3f us/access' % (name, t / n_calls * 1e6))
+
+
+if __name__ == '__main__':
+    run(main)
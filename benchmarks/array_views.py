@@ -0,0 +1,54 @@
+"""
+Time making views of all the fixed size array elements of a derived type
+instance, as done on the first access to any of them: a single call to
+``f90wrap.runtime.get_arrays`` is compared with one ``get_array`` call
+per element. Both make the same views, with the same owner.
+
+Usage: python array_views.py [n_objects] [n_elements]
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from common import build_module, run, temporary_directory
+
+
+def source(n_elements):
+    elements = '\n'.join(['        real(8) :: a%d(10)' % i for i in range(n_elements)])
+    return """
+module views_mod
+    implicit none
+    type views_type
+%s
+    end type views_type
+end module views_mod
+""" % elements
+
+
+def main(n_objects=10000, n_elements=40):
+    with temporary_directory(importable=True) as tmpdir:
+        build_module(tmpdir, 'views', source(n_elements))
+        import views
+        import f90wrap.runtime
+        cls = views.views_mod.views_type
+        obj = cls()
+        names, funcs = cls._fixed_arrays
+        sizeof_fortran_t = f90wrap.runtime.sizeof_fortran_t
+
+        def batched():
+            f90wrap.runtime.get_arrays(sizeof_fortran_t, obj._handle, funcs, owner=obj._owner)
+
+        def per_element():
+            for func in funcs:
+                f90wrap.runtime.get_array(sizeof_fortran_t, obj._handle, func, owner=obj._owner)
+
+        for label, func in (('get_arrays', batched),
+                            ('get_array per element', per_element)):
+            t = min(timeit.repeat(func, number=n_objects, repeat=3))
+            print('%-22s %8.2f us/object (%d arrays)' % (label, t / n_objects * 1e6,
+                                                         len(names)))
+
+
+if __name__ == '__main__':
+    run(main)
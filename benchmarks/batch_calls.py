@@ -0,0 +1,56 @@
+"""
+Compare calling a small wrapped Fortran kernel once per input set from a
+Python loop with a single call to its ``batch`` wrapper, generated with
+``f90wrap --batch``, which loops over the input sets in Fortran.
+
+Usage: python batch_calls.py [n_inputs]
+"""
+
+from __future__ import print_function
+
+import timeit
+
+import numpy as np
+
+from common import build_module, run, temporary_directory
+
+SOURCE = """
+module kernel_mod
+    implicit none
+contains
+    subroutine axpy(n, a, x, y)
+        integer, intent(in) :: n
+        real(8), intent(in) :: a
+        real(8), intent(in) :: x(n)
+        real(8), intent(inout) :: y(n)
+        y = a*x + y
+    end subroutine axpy
+end module kernel_mod
+"""
+
+
+def main(n_inputs=10000, n=8):
+    with temporary_directory(importable=True) as tmpdir:
+        build_module(tmpdir, 'kernel', SOURCE, kind_map=True, f90wrap_args=['--batch', 'axpy'])
+        import kernel
+        axpy = kernel.kernel_mod.axpy
+        ns = np.full(n_inputs, n, dtype=np.int32)
+        a = np.random.rand(n_inputs)
+        x = np.asfortranarray(np.random.rand(n_inputs, n))
+        y = np.zeros((n_inputs, n), order='F')
+        rows = [np.zeros(n) for i in range(n_inputs)]
+
+        def loop():
+            for i in range(n_inputs):
+                axpy(n, a[i], x[i], rows[i])
+
+        def batch():
+            axpy.batch(ns, a, x, y)
+
+        for label, func in (('python loop', loop), ('batch', batch)):
+            t = min(timeit.repeat(func, number=1, repeat=3))
+            print('%-12s %10.3f us/input' % (label, t / n_inputs * 1e6))
+
+
+if __name__ == '__main__':
+    run(main)
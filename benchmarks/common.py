@@ -0,0 +1,69 @@
+"""
+Helpers shared by the benchmark scripts in this directory.
+
+Scripts which time wrapped Fortran code build a small module with
+:func:`build_module` in a temporary directory, so gfortran, ``f90wrap``
+and ``f2py-f90wrap`` need to be available on the PATH.
+"""
+
+from __future__ import print_function
+
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+@contextlib.contextmanager
+def temporary_directory(importable=False):
+    """
+    Context manager giving the path of a new temporary directory, which is
+    removed on exit. If `importable` is true, the directory is also the
+    working directory and the first entry of `sys.path` until exit, so
+    that modules built in it can be imported.
+    """
+    tmpdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        if importable:
+            os.chdir(tmpdir)
+            sys.path.insert(0, tmpdir)
+        yield tmpdir
+    finally:
+        if importable:
+            os.chdir(cwd)
+            sys.path.remove(tmpdir)
+        shutil.rmtree(tmpdir)
+
+
+def build_module(tmpdir, name, source, kind_map=False, f90wrap_args=(), f2py_args=()):
+    """
+    Write the Fortran `source` to ``<name>_mod.f90`` in `tmpdir`, compile
+    it, and wrap it as the Python module `name` with extension module
+    ``_<name>``. If `kind_map` is true, ``real(8)`` is mapped to C
+    ``double``. `f90wrap_args` and `f2py_args` are extra command line
+    arguments of ``f90wrap`` and ``f2py-f90wrap``.
+    """
+    filename = name + '_mod.f90'
+    with open(os.path.join(tmpdir, filename), 'w') as f:
+        f.write(source)
+    f90wrap = ['f90wrap', '-m', name, filename]
+    if kind_map:
+        with open(os.path.join(tmpdir, 'kind_map'), 'w') as f:
+            f.write("{'real': {'8': 'double'}}\n")
+        f90wrap += ['-k', 'kind_map']
+    for cmd in (['gfortran', '-fPIC', '-c', filename],
+                f90wrap + list(f90wrap_args),
+                ['f2py-f90wrap'] + list(f2py_args) +
+                ['--build-dir', '.', '-c', '-m', '_' + name,
+                 name + '_mod.o', 'f90wrap_' + filename]):
+        subprocess.check_call(cmd, cwd=tmpdir, stdout=subprocess.PIPE)
+
+
+def run(main):
+    """
+    Call `main` with the command line arguments of the script, as integers
+    """
+    main(*[int(arg) for arg in sys.argv[1:]])
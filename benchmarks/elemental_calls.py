@@ -0,0 +1,49 @@
+"""
+Compare applying a wrapped elemental Fortran function to an array with
+``np.vectorize``, which calls it once per element, with passing the whole
+array to the wrapper, which broadcasts it and makes a single Fortran call.
+
+Usage: python elemental_calls.py [n_elements]
+"""
+
+from __future__ import print_function
+
+import timeit
+
+import numpy as np
+
+from common import build_module, run, temporary_directory
+
+SOURCE = """
+module sinc_mod
+    implicit none
+contains
+    elemental function sinc(x)
+        real(8), intent(in) :: x
+        real(8) :: sinc
+        if (abs(x) > 1d-5) then
+            sinc = sin(x)/x
+        else
+            sinc = 1d0
+        end if
+    end function sinc
+end module sinc_mod
+"""
+
+
+def main(n_elements=100000):
+    with temporary_directory(importable=True) as tmpdir:
+        build_module(tmpdir, 'sinc', SOURCE, kind_map=True)
+        import sinc
+        func = sinc.sinc_mod.sinc
+        vectorized = np.vectorize(func)
+        x = np.random.rand(100, n_elements // 100)
+
+        for label, call in (('np.vectorize', lambda: vectorized(x)),
+                            ('broadcast', lambda: func(x))):
+            t = min(timeit.repeat(call, number=1, repeat=3))
+            print('%-14s %10.4f us/element' % (label, t / x.size * 1e6))
+
+
+if __name__ == '__main__':
+    run(main)
@@ -0,0 +1,71 @@
+"""
+Compare the per-call overhead of the two ways generated wrappers can
+dispatch a call to an overloaded Fortran interface with six specific
+procedures: trying each procedure in turn until one does not raise a
+`TypeError`, and :class:`f90wrap.runtime.overload`.
+
+The specific procedures are plain Python functions which check their
+arguments the way the f2py wrappers do, so only the dispatch overhead is
+measured. Calls resolving to the last specific are the worst case for the
+try-each loop.
+
+Usage: python overload_dispatch.py [n_calls]
+"""
+
+from __future__ import print_function
+
+import timeit
+
+import numpy as np
+
+import f90wrap.runtime
+
+from common import run
+
+SPECIFICS = [('i', 0, 'i'), ('f', 0, 'd'), ('c', 0, 'D'),
+             ('i', 1, 'i'), ('f', 1, 'd'), ('c', 1, 'D')]
+
+
+def make_specific(kind, rank, dtype):
+    def specific(x):
+        if isinstance(x, np.ndarray):
+            if x.ndim != rank or x.dtype.char != dtype:
+                raise TypeError('wrong dtype or rank')
+        elif rank != 0 or np.asarray(x).dtype.kind != kind:
+            raise TypeError('wrong type')
+        return x
+    return specific
+
+
+procedures = [make_specific(*spec) for spec in SPECIFICS]
+
+
+def try_each(*args, **kwargs):
+    for proc in procedures:
+        try:
+            return proc(*args, **kwargs)
+        except TypeError:
+            continue
+
+
+@f90wrap.runtime.overload([[('x', kind, rank, dtype, False)]
+                           for (kind, rank, dtype) in SPECIFICS])
+def dispatch(*args, **kwargs):
+    return procedures
+
+
+def main(n_calls=100000):
+    cases = [('scalar int (1st of 6)', 1),
+             ('scalar float (2nd of 6)', 1.0),
+             ('complex array (6th of 6)', np.zeros(3, dtype=complex))]
+    print('%-26s %14s %14s' % ('arguments', 'try-each/us', 'overload/us'))
+    for label, arg in cases:
+        times = []
+        for func in (try_each, dispatch):
+            t = min(timeit.repeat(lambda: func(arg), number=n_calls, repeat=3))
+            times.append(t / n_calls * 1e6)
+        print('%-26s %14.2f %14.2f' % (label, times[0], times[1]))
+
+
+if __name__ == '__main__':
+    run(main)
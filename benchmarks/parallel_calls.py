@@ -0,0 +1,72 @@
+"""
+Time calling a wrapped Fortran routine for many sets of arguments with
+``f90wrap.runtime.parallel``: in a Python loop, with ``map_threads`` in a
+thread pool, with ``map_processes`` in a pool of worker processes which
+import the wrapped module once, and in a pool which starts a new worker
+process for each call. The module is built with ``f2py-f90wrap
+--release-gil``, so that calls in threads can overlap.
+
+Usage: python parallel_calls.py [n_calls] [n]
+"""
+
+from __future__ import print_function
+
+import importlib
+import multiprocessing
+import os
+import timeit
+
+import numpy as np
+
+from common import build_module, run, temporary_directory
+
+SOURCE = """
+module work_mod
+    implicit none
+contains
+    function smooth(n, x)
+        integer, intent(in) :: n
+        real(8), intent(in) :: x(n)
+        real(8) :: smooth
+        integer :: i, j
+        smooth = 0d0
+        do j = 1, 20
+            do i = 2, n - 1
+                smooth = smooth + abs(x(i - 1) - 2*x(i) + x(i + 1))
+            end do
+        end do
+    end function smooth
+end module work_mod
+"""
+
+
+def main(n_calls=64, n=200000):
+    with temporary_directory(importable=True) as tmpdir:
+        build_module(tmpdir, 'work', SOURCE, kind_map=True, f2py_args=['--release-gil'])
+        os.environ['PYTHONPATH'] = os.pathsep.join([tmpdir, os.environ.get('PYTHONPATH', '')])
+        import work
+        from f90wrap.runtime import parallel
+        smooth = work.work_mod.smooth
+        args = [(n, np.random.rand(n)) for i in range(n_calls)]
+
+        def process_per_call():
+            pool = multiprocessing.Pool(initializer=importlib.import_module,
+                                        initargs=('work',), maxtasksperchild=1)
+            try:
+                pool.starmap(smooth, args, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+        parallel.map_processes(smooth, args[:1])  # start the workers
+        for label, func in (('python loop', lambda: [smooth(*a) for a in args]),
+                            ('map_threads', lambda: parallel.map_threads(smooth, args)),
+                            ('map_processes', lambda: parallel.map_processes(smooth, args)),
+                            ('process per call', process_per_call)):
+            t = min(timeit.repeat(func, number=1, repeat=3))
+            print('%-18s %10.3f ms/call' % (label, t / n_calls * 1e3))
+        parallel.shutdown()
+
+
+if __name__ == '__main__':
+    run(main)
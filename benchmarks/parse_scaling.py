@@ -0,0 +1,68 @@
+"""
+Time tokenisation with :class:`f90wrap.parser.F90File` and a full
+:func:`f90wrap.parser.read_files` parse on synthetic Fortran modules of
+increasing size. Both should scale linearly, i.e. the time per source
+line should stay roughly constant as the file grows.
+
+Usage: python parse_scaling.py [max_routines]
+"""
+
+from __future__ import print_function
+
+import os
+import time
+
+from f90wrap import parser as fparse
+
+from common import run, temporary_directory
+
+ROUTINE = """
+    !%% Routine number %(i)d
+    subroutine sub_%(i)d(a, b, &
+                         c)
+        real(8), intent(in) :: a ! first argument
+        real(8), intent(in) :: b
+        real(8), intent(out) :: c
+        c = a + &
+            & b
+    end subroutine sub_%(i)d
+"""
+
+
+def write_module(path, n_routines):
+    with open(path, 'w') as f:
+        f.write('module big_mod\n    implicit none\ncontains\n')
+        for i in range(n_routines):
+            f.write(ROUTINE % {'i': i})
+        f.write('end module big_mod\n')
+
+
+def tokenise(path):
+    f90file = fparse.F90File(path)
+    while f90file.next() is not None:
+        pass
+
+
+def main(max_routines=4000):
+    with temporary_directory() as tmpdir:
+        n = 500
+        print('%10s %10s %12s %12s %12s %12s' % ('routines', 'lines',
+                                                 'tokenise/s', 'us/line',
+                                                 'parse/s', 'us/line'))
+        while n <= max_routines:
+            path = os.path.join(tmpdir, 'big_mod_%d.f90' % n)
+            write_module(path, n)
+            n_lines = sum(1 for _ in open(path))
+            t0 = time.time()
+            tokenise(path)
+            t1 = time.time()
+            fparse.read_files([path])
+            t2 = time.time()
+            print('%10d %10d %12.3f %12.2f %12.3f %12.2f' % (n, n_lines,
+                                                           t1 - t0, 1e6 * (t1 - t0) / n_lines,
+                                                           t2 - t1, 1e6 * (t2 - t1) / n_lines))
+            n *= 2
+
+
+if __name__ == '__main__':
+    run(main)
@@ -0,0 +1,125 @@
+"""
+Time :func:`f90wrap.transform.transform_to_generic_wrapper` on a synthetic
+module with a derived type and many procedures which use it. The visitor
+and transformer passes make up most of the run time.
+
+Each run is timed twice: with the dispatch of `FortranVisitor.visit` to
+visitor methods cached per visitor and node class, as f90wrap does, and
+with the method looked up through the node class's MRO on every visit,
+as f90wrap did before the cache was added.
+
+Usage: python transform_generic.py [n_routines]
+"""
+
+from __future__ import print_function
+
+import copy
+import os
+import time
+
+from f90wrap import fortran as ft
+from f90wrap import parser as fparse
+from f90wrap import transform as tf
+
+from common import run, temporary_directory
+
+HEADER = """
+module big_mod
+    implicit none
+    type big_type
+        real(8) :: x
+        integer :: n(10)
+    end type big_type
+contains
+    subroutine big_type_initialise(this)
+        type(big_type), intent(inout) :: this
+        this%x = 0.0
+    end subroutine big_type_initialise
+
+    subroutine big_type_finalise(this)
+        type(big_type), intent(inout) :: this
+    end subroutine big_type_finalise
+"""
+
+ROUTINE = """
+    subroutine sub_%(i)d(this, a, b, c)
+        type(big_type), intent(inout) :: this
+        real(8), intent(in) :: a
+        integer, intent(in) :: b(:)
+        real(8), intent(out) :: c
+        c = a + this%%x
+    end subroutine sub_%(i)d
+"""
+
+
+def write_module(path, n_routines):
+    with open(path, 'w') as f:
+        f.write(HEADER)
+        for i in range(n_routines):
+            f.write(ROUTINE % {'i': i})
+        f.write('end module big_mod\n')
+
+
+def transform(tree):
+    types = ft.find_types(tree)
+    modules_for_type = dict((typ.mod_name, typ.mod_name) for typ in types.values())
+    tf.transform_to_generic_wrapper(tree, types,
+                                    callbacks=[],
+                                    constructors=['initialise'],
+                                    destructors=['finalise'],
+                                    short_names={},
+                                    init_lines={},
+                                    argument_name_map={},
+                                    move_methods=False,
+                                    shorten_routine_names=False,
+                                    modules_for_type=modules_for_type,
+                                    remove_optional_arguments=[])
+
+
+def uncached_visit(self, node):
+    candidate_methods = ['visit_' + cls.__name__ for cls in
+                         node.__class__.__mro__]
+    for method in candidate_methods:
+        try:
+            visitor = getattr(self, method)
+            break
+        except AttributeError:
+            continue
+    else:
+        visitor = self.generic_visit
+
+    result = visitor(node)
+    return result
+
+
+def time_transform(tree, repeat):
+    times = []
+    for i in range(repeat):
+        tree_copy = copy.deepcopy(tree)
+        t0 = time.time()
+        transform(tree_copy)
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def main(n_routines=1000, repeat=3):
+    with temporary_directory() as tmpdir:
+        path = os.path.join(tmpdir, 'big_mod.f90')
+        write_module(path, n_routines)
+        tree = fparse.read_files([path])
+    n_nodes = sum(1 for _ in ft.walk(tree))
+    cached = time_transform(tree, repeat)
+    visit = ft.FortranVisitor.visit
+    ft.FortranVisitor.visit = uncached_visit
+    try:
+        uncached = time_transform(tree, repeat)
+    finally:
+        ft.FortranVisitor.visit = visit
+    print('%d routines, %d nodes: transform_to_generic_wrapper best of %d' %
+          (n_routines, n_nodes, repeat))
+    print('%-18s %8.3f s' % ('cached dispatch', cached))
+    print('%-18s %8.3f s' % ('uncached dispatch', uncached))
+
+
+if __name__ == '__main__':
+    run(main)
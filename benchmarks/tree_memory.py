@@ -0,0 +1,79 @@
+"""
+Measure the memory used by a large synthetic :mod:`f90wrap.fortran` parse
+tree, and by a deep copy of it as made in :func:`f90wrap.wrapper.main`.
+
+The tree has `n_modules` modules, each with a derived type and a number of
+procedures, for a total of around `n_modules * 1000` arguments and
+elements. Transformation-only attributes such as `orig_name` and `py_name`
+are set on every declaration, as they would be after wrapping.
+
+Usage: python tree_memory.py [n_modules]
+
+Requires Python 3 for the tracemalloc module.
+"""
+
+from __future__ import print_function
+
+import copy
+import time
+import tracemalloc
+
+from f90wrap import fortran as ft
+
+from common import run
+
+N_PROCEDURES = 100
+N_ARGUMENTS = 8
+N_ELEMENTS = 200
+
+
+def make_tree(n_modules):
+    root = ft.Root()
+    for m in range(n_modules):
+        mod = ft.Module(name='mod_%d' % m, filename='mod_%d.f90' % m)
+        typ = ft.Type(name='t_%d' % m, filename=mod.filename, mod_name=mod.name)
+        for e in range(N_ELEMENTS):
+            el = ft.Element(name='el_%d' % e, filename=mod.filename,
+                            type='real(8)', attributes=['dimension(:)'])
+            el.orig_name = el.name
+            typ.elements.append(el)
+        mod.types.append(typ)
+        for p in range(N_PROCEDURES):
+            sub = ft.Subroutine(name='sub_%d' % p, filename=mod.filename,
+                                mod_name=mod.name)
+            sub.orig_name = sub.name
+            for a in range(N_ARGUMENTS):
+                arg = ft.Argument(name='arg_%d' % a, filename=mod.filename,
+                                  type='integer', attributes=['intent(in)'])
+                arg.orig_name = arg.name
+                arg.py_name = arg.name
+                arg.py_value = arg.name
+                sub.arguments.append(arg)
+            mod.procedures.append(sub)
+        root.modules.append(mod)
+    return root
+
+
+def main(n_modules=200):
+    n_decls = n_modules * (N_ELEMENTS + N_PROCEDURES * N_ARGUMENTS)
+    print('%d modules, %d arguments and elements' % (n_modules, n_decls))
+
+    tracemalloc.start()
+    t0 = time.time()
+    tree = make_tree(n_modules)
+    t1 = time.time()
+    tree_size, _ = tracemalloc.get_traced_memory()
+    copies = [copy.deepcopy(tree) for _ in range(3)]
+    t2 = time.time()
+    total_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('%-24s %10.1f MB %8.1f bytes/declaration %8.2f s' %
+          ('tree', tree_size / 1e6, float(tree_size) / n_decls, t1 - t0))
+    print('%-24s %10.1f MB %8.1f bytes/declaration %8.2f s' %
+          ('tree + 3 deep copies', total_size / 1e6, float(total_size) / n_decls, t2 - t1))
+    del copies
+
+
+if __name__ == '__main__':
+    run(main)
@@ -0,0 +1,31 @@
+module kernels
+    implicit none
+
+contains
+
+    subroutine axpy(n, a, x, y)
+        integer, intent(in) :: n
+        real(8), intent(in) :: a
+        real(8), intent(in) :: x(n)
+        real(8), intent(inout) :: y(n)
+
+        y = a*x + y
+    end subroutine axpy
+
+    subroutine moments(x, mean, maximum)
+        real(8), intent(in) :: x(:)
+        real(8), intent(out) :: mean, maximum
+
+        mean = sum(x)/size(x)
+        maximum = maxval(x)
+    end subroutine moments
+
+    function dot(n, x, y) result(d)
+        integer, intent(in) :: n
+        real(8), intent(in) :: x(n), y(n)
+        real(8) :: d
+
+        d = sum(x*y)
+    end function dot
+
+end module kernels
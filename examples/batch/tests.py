@@ -0,0 +1,58 @@
+"""
+Tests of the batch wrappers generated with f90wrap --batch, which call a
+routine for each item along the leading dimension of their arguments in
+a single Fortran loop. Their results should be the same as calling the
+routine for each item from Python.
+"""
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+import kern
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.n_items, self.n = 6, 5
+        self.x = np.asfortranarray(rng.rand(self.n_items, self.n))
+        self.y = np.asfortranarray(rng.rand(self.n_items, self.n))
+        self.a = rng.rand(self.n_items)
+        self.ns = np.full(self.n_items, self.n, dtype=np.int32)
+
+    def test_attribute(self):
+        self.assertEqual(kern.kernels.axpy.batch.__name__, 'axpy_batch')
+
+    def test_function(self):
+        d = kern.kernels.dot.batch(self.ns, self.x, self.y)
+        expected = [kern.kernels.dot(self.n, self.x[i], self.y[i])
+                    for i in range(self.n_items)]
+        self.assertEqual(d.shape, (self.n_items,))
+        self.assertTrue(np.allclose(d, expected))
+
+    def test_intent_out(self):
+        mean, maximum = kern.kernels.moments.batch(self.x)
+        expected = [kern.kernels.moments(self.x[i]) for i in range(self.n_items)]
+        self.assertTrue(np.allclose(mean, [m for (m, mx) in expected]))
+        self.assertTrue(np.allclose(maximum, [mx for (m, mx) in expected]))
+
+    def test_intent_inout(self):
+        y = self.y.copy(order='F')
+        kern.kernels.axpy.batch(self.ns, self.a, self.x, y)
+        for i in range(self.n_items):
+            row = self.y[i].copy()
+            kern.kernels.axpy(self.n, self.a[i], self.x[i], row)
+            self.assertTrue(np.allclose(y[i], row))
+
+    def test_empty_batch(self):
+        mean, maximum = kern.kernels.moments.batch(np.zeros((0, self.n), order='F'))
+        self.assertEqual(mean.shape, (0,))
+        self.assertEqual(maximum.shape, (0,))
+
+
+if __name__ == '__main__':
+    unittest.main()
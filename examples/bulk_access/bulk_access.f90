@@ -0,0 +1,38 @@
+module bulk_access
+    implicit none
+
+    type point
+        real(8) :: x, y
+        integer :: label
+    end type point
+
+    type holder
+        type(point), allocatable :: pts(:)
+        real(8) :: weights(4)
+        integer :: counts(3)
+    end type holder
+
+contains
+
+    subroutine allocate_points(h, n)
+        type(holder), intent(inout) :: h
+        integer, intent(in) :: n
+        integer :: i
+
+        if (allocated(h%pts)) deallocate(h%pts)
+        allocate(h%pts(n))
+        do i = 1, n
+            h%pts(i)%x = i
+            h%pts(i)%y = -i
+            h%pts(i)%label = 10*i
+        end do
+    end subroutine allocate_points
+
+    function total_weight(h) result(total)
+        type(holder), intent(in) :: h
+        real(8) :: total
+
+        total = sum(h%weights)
+    end function total_weight
+
+end module bulk_access
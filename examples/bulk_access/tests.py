@@ -0,0 +1,176 @@
+"""
+Tests of bulk access to the items of an array of derived types: copying
+one element of every item to or from a numpy array with gather() and
+scatter(), and viewing all the items as a numpy structured array, and
+views of the fixed size arrays of a derived type, which keep its Fortran
+memory alive after the Python object has gone.
+
+`make test` also runs these tests with wrappers built with
+f2py-f90wrap --fast-accessors, which should still raise exceptions from
+the derived type array accessors that can abort.
+"""
+
+from __future__ import print_function
+
+import gc
+import unittest
+
+import numpy as np
+
+import f90wrap.runtime
+from f90wrap.fortrantype import _FortranMemory, _FortranOwner
+
+import bulk
+
+
+def owner_of(array):
+    """
+    Return the token owning the Fortran memory viewed by `array`
+    """
+    base = array.base
+    while not isinstance(base, _FortranOwner):
+        if isinstance(base, _FortranMemory):
+            base = base.owner
+        else:
+            base = base.base
+    return base
+
+
+class FinaliserCalls(object):
+    """
+    Record the calls to the Fortran finaliser deferred to `owner`
+    """
+
+    def __init__(self, owner):
+        self.count = 0
+        self.finaliser = owner.finaliser
+        owner.finaliser = self
+
+    def __call__(self, **kwargs):
+        self.count += 1
+        self.finaliser(**kwargs)
+
+
+class TestBulkAccess(unittest.TestCase):
+
+    def setUp(self):
+        self.h = bulk.bulk_access.holder()
+        bulk.bulk_access.allocate_points(self.h, 4)
+
+    def test_gather(self):
+        self.assertTrue(np.all(self.h.pts.gather('x') == [1.0, 2.0, 3.0, 4.0]))
+        self.assertTrue(np.all(self.h.pts.gather('y') == [-1.0, -2.0, -3.0, -4.0]))
+        self.assertTrue(np.all(self.h.pts.gather('label') == [10, 20, 30, 40]))
+
+    def test_scatter(self):
+        self.h.pts.scatter('x', np.array([9.0, 8.0, 7.0, 6.0]))
+        self.h.pts.scatter('label', [1, 2, 3, 4])
+        self.assertTrue(np.all(self.h.pts.gather('x') == [9.0, 8.0, 7.0, 6.0]))
+        self.assertTrue(np.all(self.h.pts.gather('label') == [1, 2, 3, 4]))
+        self.assertEqual(self.h.pts[2].x, 7.0)
+
+    def test_scatter_wrong_length(self):
+        self.assertRaises(RuntimeError, self.h.pts.scatter, 'x', np.array([1.0, 2.0]))
+        self.assertRaises(RuntimeError, self.h.pts.scatter, 'x', np.arange(6.0))
+        self.assertTrue(np.all(self.h.pts.gather('x') == [1.0, 2.0, 3.0, 4.0]))
+
+    def test_unknown_element(self):
+        self.assertRaises(ValueError, self.h.pts.gather, 'z')
+
+    def test_index_out_of_range(self):
+        self.assertEqual(len(self.h.pts), 4)
+        self.assertRaises(RuntimeError, self.h.pts.__getitem__, 10)
+        self.assertRaises(RuntimeError, self.h.pts.__setitem__, -1, self.h.pts[0])
+        self.assertRaises(RuntimeError, bulk.bulk_access.holder().pts.__getitem__, 0)
+
+    def test_as_structured_array(self):
+        records = self.h.pts.as_structured_array()
+        self.assertEqual(records.shape, (4,))
+        self.assertTrue(np.all(records['y'] == [-1.0, -2.0, -3.0, -4.0]))
+        # a view of the Fortran memory, not a copy
+        records['label'][1] = 99
+        self.assertEqual(self.h.pts[1].label, 99)
+        self.h.pts[3].x = 0.5
+        self.assertEqual(records['x'][3], 0.5)
+
+    def test_fixed_arrays(self):
+        self.assertEqual(self.h._arrays, {})
+        weights = self.h.weights
+        # the views of all the fixed size arrays are made at once
+        self.assertEqual(sorted(self.h._arrays), ['counts', 'weights'])
+        self.assertTrue(self.h.counts is self.h._arrays['counts'])
+        self.assertTrue(self.h.weights is weights)
+        self.assertEqual(weights.shape, (4,))
+        self.assertEqual(self.h.counts.shape, (3,))
+        # views of the Fortran memory, not copies
+        weights[:] = [1.0, 2.0, 3.0, 4.5]
+        self.assertEqual(bulk.bulk_access.total_weight(self.h), 10.5)
+        self.h.weights = 0.25
+        self.assertEqual(bulk.bulk_access.total_weight(self.h), 1.0)
+
+    def test_array_outlives_instance(self):
+        h = bulk.bulk_access.holder()
+        weights = h.weights
+        weights[:] = [1.0, 2.0, 3.0, 4.0]
+        del h
+        gc.collect()
+        owner = owner_of(weights)
+        self.assertTrue(owner.finaliser is not None)
+        calls = FinaliserCalls(owner)
+        del owner
+        # instances allocated now would reuse the memory if it had been freed
+        others = [bulk.bulk_access.holder() for i in range(8)]
+        for other in others:
+            other.weights = -1.0
+        self.assertEqual(calls.count, 0)
+        self.assertTrue(np.all(weights == [1.0, 2.0, 3.0, 4.0]))
+        weights[0] = 5.0
+        self.assertEqual(weights.sum(), 14.0)
+        del weights
+        gc.collect()
+        self.assertEqual(calls.count, 1)
+
+    def test_item_record_outlives_parent(self):
+        h = bulk.bulk_access.holder()
+        bulk.bulk_access.allocate_points(h, 3)
+        record = h.pts[1].as_record()
+        records = h.pts.as_structured_array()
+        del h
+        gc.collect()
+        # both views keep the memory of the holder alive
+        calls = FinaliserCalls(owner_of(records))
+        self.assertTrue(owner_of(record).parent is owner_of(records))
+        self.assertEqual(record['label'], 20)
+        del records
+        gc.collect()
+        self.assertEqual(calls.count, 0)
+        self.assertEqual(record['x'], 2.0)
+        del record
+        gc.collect()
+        self.assertEqual(calls.count, 1)
+
+    def test_cache_capacity_shared(self):
+        capacity = f90wrap.runtime.cache_info()['capacity']
+        f90wrap.runtime.set_cache_capacity(4)
+        try:
+            holders = [bulk.bulk_access.holder() for i in range(3)]
+            for h in holders:
+                bulk.bulk_access.allocate_points(h, 3)
+                for p in h.pts:
+                    pass
+            p = None
+            gc.collect()
+            # the bound is on the objects kept alive by all caches together
+            self.assertEqual(f90wrap.runtime.cache_info()['size'], 4)
+            self.assertEqual(sum([len(h._objs) for h in holders]), 4)
+            # items accessed again are found in the cache of their parent
+            self.assertTrue(holders[2].pts[2] is holders[2].pts[2])
+            f90wrap.runtime.clear_caches()
+            self.assertEqual(f90wrap.runtime.cache_info()['size'], 0)
+            self.assertEqual(sum([len(h._objs) for h in holders]), 0)
+        finally:
+            f90wrap.runtime.set_cache_capacity(capacity)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,4 +10,10 @@ sinc = 1.0d0
 endif
 return
 end function sinc
+elemental subroutine polar(x, y, r, theta)
+real(kind=8), intent(in) :: x, y
+real(kind=8), intent(out) :: r, theta
+r = sqrt(x**2 + y**2)
+theta = atan2(y, x)
+end subroutine polar
 end module elemental_module
\ No newline at end of file
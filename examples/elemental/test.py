@@ -1,4 +1,16 @@
+import numpy as np
 import elmod
 from math import pi
 
-assert elmod.Elemental_Module.sinc(pi/2) == 2.0/pi
\ No newline at end of file
+assert elmod.Elemental_Module.sinc(pi/2) == 2.0/pi
+
+# elemental routines also accept arrays of any shape, broadcast together
+x = np.linspace(0.5, 3.0, 12).reshape(3, 4)
+assert np.allclose(elmod.Elemental_Module.sinc(x), np.sin(x)/x)
+assert elmod.Elemental_Module.sinc(x[:, ::2]).shape == (3, 2)
+
+y = np.array([[1.0], [2.0], [3.0]])
+r, theta = elmod.Elemental_Module.polar(x, y)
+assert r.shape == theta.shape == (3, 4)
+assert np.allclose(r, np.hypot(x, y))
+assert np.allclose(theta, np.arctan2(y, x))
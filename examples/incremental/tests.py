@@ -0,0 +1,90 @@
+"""
+Tests of f90wrap --incremental: after a source file is changed, wrappers
+regenerated incrementally should be the same as wrappers generated from
+scratch, including for modules whose types have methods defined in the
+changed file.
+"""
+
+from __future__ import print_function
+
+import filecmp
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+A_SOURCE = """
+module a_mod
+    implicit none
+    type t
+        integer :: n
+    end type t
+end module a_mod
+"""
+
+# t_n_initialise() is a constructor in an interface, so it is wrapped as a
+# method of type t in the wrappers of module a_mod
+B_SOURCE = """
+module b_mod
+    use a_mod
+    implicit none
+    interface t_initialise
+        module procedure t_n_initialise
+    end interface t_initialise
+contains
+    subroutine t_n_initialise(this, %(args)s)
+        type(t), intent(out) :: this
+        integer, intent(in) :: %(args)s
+        this%%n = %(value)s
+    end subroutine t_n_initialise
+end module b_mod
+"""
+
+
+def write_sources(dirname, args, value):
+    with open(os.path.join(dirname, 'a.f90'), 'w') as f:
+        f.write(A_SOURCE)
+    with open(os.path.join(dirname, 'b.f90'), 'w') as f:
+        f.write(B_SOURCE % {'args': args, 'value': value})
+
+
+def run_f90wrap(dirname, *options):
+    subprocess.check_call(['f90wrap', '-m', 'inc', 'a.f90', 'b.f90', '-P'] + list(options),
+                          cwd=dirname, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.incremental = os.path.join(self.tmpdir, 'incremental')
+        self.scratch = os.path.join(self.tmpdir, 'scratch')
+        os.mkdir(self.incremental)
+        os.mkdir(self.scratch)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertSameWrappers(self):
+        for name in ['f90wrap_a.f90', 'f90wrap_b.f90',
+                     os.path.join('inc', 'a_mod.py'), os.path.join('inc', 'b_mod.py')]:
+            self.assertTrue(filecmp.cmp(os.path.join(self.incremental, name),
+                                        os.path.join(self.scratch, name), shallow=False),
+                            '%s differs from the wrapper generated from scratch' % name)
+
+    def test_method_from_other_module(self):
+        write_sources(self.incremental, 'n', 'n')
+        run_f90wrap(self.incremental, '--incremental')
+
+        write_sources(self.incremental, 'n, k', 'n + k')
+        run_f90wrap(self.incremental, '--incremental')
+        write_sources(self.scratch, 'n, k', 'n + k')
+        run_f90wrap(self.scratch)
+        self.assertSameWrappers()
+        with open(os.path.join(self.incremental, 'f90wrap_a.f90')) as f:
+            self.assertTrue('f90wrap_t_n_initialise(this, n, k)' in f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
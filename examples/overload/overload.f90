@@ -0,0 +1,41 @@
+module overload
+    implicit none
+
+    interface describe
+        module procedure describe_int, describe_real, describe_int_vec, &
+            describe_real_vec, describe_real_mat
+    end interface describe
+
+contains
+
+    function describe_int(x) result(code)
+        integer, intent(in) :: x
+        integer :: code
+        code = 1
+    end function describe_int
+
+    function describe_real(x) result(code)
+        real(8), intent(in) :: x
+        integer :: code
+        code = 2
+    end function describe_real
+
+    function describe_int_vec(x) result(code)
+        integer, intent(in) :: x(:)
+        integer :: code
+        code = 3
+    end function describe_int_vec
+
+    function describe_real_vec(x) result(code)
+        real(8), intent(in) :: x(:)
+        integer :: code
+        code = 4
+    end function describe_real_vec
+
+    function describe_real_mat(x) result(code)
+        real(8), intent(in) :: x(:, :)
+        integer :: code
+        code = 5
+    end function describe_real_mat
+
+end module overload
@@ -0,0 +1,47 @@
+"""
+Tests of the dispatch of calls to an overloaded interface to the specific
+procedure matching the kinds and ranks of the arguments. Each specific
+procedure of `describe` returns a different code.
+"""
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+import ovl
+
+
+class TestOverload(unittest.TestCase):
+
+    def test_kind(self):
+        self.assertEqual(ovl.overload.describe(1), 1)
+        self.assertEqual(ovl.overload.describe(1.5), 2)
+        self.assertEqual(ovl.overload.describe(np.int64(3)), 1)
+        self.assertEqual(ovl.overload.describe(np.float32(1.0)), 2)
+
+    def test_rank(self):
+        self.assertEqual(ovl.overload.describe(np.arange(3, dtype=np.int32)), 3)
+        self.assertEqual(ovl.overload.describe(np.zeros(3)), 4)
+        self.assertEqual(ovl.overload.describe(np.zeros((2, 2), order='F')), 5)
+
+    def test_repeated_calls(self):
+        # later calls with the same argument types use the dispatch table
+        for i in range(3):
+            self.assertEqual(ovl.overload.describe(np.zeros(3)), 4)
+            self.assertEqual(ovl.overload.describe(i), 1)
+            self.assertEqual(ovl.overload.describe(float(i)), 2)
+
+    def test_keyword(self):
+        self.assertEqual(ovl.overload.describe(x=2.0), 2)
+        self.assertEqual(ovl.overload.describe(x=np.zeros(2)), 4)
+
+    def test_no_match(self):
+        self.assertRaises(TypeError, ovl.overload.describe, np.zeros((2, 2, 2)))
+        self.assertRaises(TypeError, ovl.overload.describe, 'abc')
+        self.assertRaises(TypeError, ovl.overload.describe, 1, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+module parallel_work
+    implicit none
+
+    type particle
+        real(8) :: pos(3)
+        real(8) :: mass
+        integer :: id
+    end type particle
+
+contains
+
+    function total(n, x) result(s)
+        integer, intent(in) :: n
+        real(8), intent(in) :: x(n)
+        real(8) :: s
+
+        s = sum(x)
+    end function total
+
+    function shifted(p, dx) result(q)
+        type(particle), intent(in) :: p
+        real(8), intent(in) :: dx
+        type(particle) :: q
+
+        q = p
+        q%pos = p%pos + dx
+        q%id = p%id + 1
+    end function shifted
+
+    function momentum(p, v) result(m)
+        type(particle), intent(in) :: p
+        real(8), intent(in) :: v
+        real(8) :: m
+
+        m = p%mass*v + p%id
+    end function momentum
+
+end module parallel_work
@@ -0,0 +1,91 @@
+"""
+Tests of calling wrapped routines for many sets of arguments with
+f90wrap.runtime.parallel, in a pool of threads and in a pool of worker
+processes. Results should be the same as calling the routines in a loop.
+"""
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from f90wrap.runtime import parallel
+
+import pwork
+
+
+class TestParallel(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        parallel.shutdown()
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.arrays = [rng.rand(n) for n in (1, 5, 100, 1000)]
+        self.p = pwork.parallel_work.particle()
+        self.p.pos = [1.0, 2.0, 3.0]
+        self.p.mass = 2.0
+        self.p.id = 7
+
+    def expected_totals(self):
+        return [pwork.parallel_work.total(len(x), x) for x in self.arrays]
+
+    def test_map_threads(self):
+        totals = parallel.map_threads(pwork.parallel_work.total,
+                                      [(len(x), x) for x in self.arrays], workers=2)
+        self.assertEqual(totals, self.expected_totals())
+
+    def test_map_processes(self):
+        totals = parallel.map_processes(pwork.parallel_work.total,
+                                        [(len(x), x) for x in self.arrays], workers=2)
+        self.assertEqual(totals, self.expected_totals())
+
+    def test_single_argument(self):
+        # items which are not tuples are passed as the only argument
+        records = parallel.map_processes(pwork.parallel_work.particle.as_record, [self.p])
+        self.assertEqual(records[0]['id'], 7)
+
+    def test_type_arguments(self):
+        momenta = parallel.map_processes(pwork.parallel_work.momentum,
+                                         [(self.p, v) for v in (0.0, 1.0, 2.5)])
+        self.assertEqual(momenta, [7.0, 9.0, 12.0])
+
+    def test_type_results(self):
+        shifted = parallel.map_processes(pwork.parallel_work.shifted,
+                                         [(self.p, dx) for dx in (0.0, 1.0)])
+        for q, dx in zip(shifted, (0.0, 1.0)):
+            self.assertTrue(isinstance(q, pwork.parallel_work.particle))
+            self.assertTrue(np.all(q.pos == self.p.pos + dx))
+            self.assertEqual(q.mass, 2.0)
+            self.assertEqual(q.id, 8)
+        # the argument is copied to the workers, not changed
+        self.assertEqual(self.p.id, 7)
+
+    @unittest.skipIf(parallel.shared_memory is None,
+                     'multiprocessing.shared_memory is only available from Python 3.8')
+    def test_shared_memory(self):
+        shared = []
+        share = parallel._share
+
+        def record_share(array, blocks):
+            shared.append(array.nbytes)
+            return share(array, blocks)
+
+        threshold = parallel.share_threshold
+        parallel.share_threshold = 800
+        parallel._share = record_share
+        try:
+            totals = parallel.map_processes(pwork.parallel_work.total,
+                                            [(len(x), x) for x in self.arrays])
+        finally:
+            parallel.share_threshold = threshold
+            parallel._share = share
+        # only the arrays of at least share_threshold bytes are shared
+        self.assertEqual(shared, [800, 8000])
+        self.assertEqual(totals, self.expected_totals())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+"""
+Stress test of f90wrap_abort() with concurrent calls: Fortran routines
+running in a thread pool, with the GIL released, abort at the same time
+and each caller should get back a RuntimeError with its own message.
+"""
+
+from __future__ import print_function
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import threaded_abort_test
+
+
+def call(n):
+    try:
+        return threaded_abort_test.threaded_abort.checked_sum(n)
+    except RuntimeError as error:
+        return str(error)
+
+
+class TestThreadedAbort(unittest.TestCase):
+
+    def test_abort(self):
+        self.assertRaises(RuntimeError, threaded_abort_test.threaded_abort.checked_sum, 1)
+        self.assertTrue(isinstance(threaded_abort_test.threaded_abort.checked_sum(2), float))
+
+    def test_concurrent_abort(self):
+        n_values = list(range(1, 401))
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(call, n_values))
+        for n, result in zip(n_values, results):
+            if n % 2 == 1:
+                self.assertEqual(result, 'odd argument %d' % n)
+            else:
+                self.assertEqual(result, call(n))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+module threaded_abort
+
+  implicit none
+
+contains
+
+  ! Sum of sin(i) for i = 1..n, calling f90wrap_abort() for odd n with a
+  ! message which depends on n, so that callers can check that they get
+  ! back their own error
+  subroutine checked_sum(n, total)
+    integer, intent(in) :: n
+    double precision, intent(out) :: total
+
+    integer :: i
+    character(len=64) :: message
+
+    total = 0.0d0
+    do i = 1, 1000 * n
+       total = total + sin(dble(i))
+    end do
+    if (mod(n, 2) == 1) then
+       write(message, '(a,i0)') 'odd argument ', n
+       call f90wrap_abort(trim(message))
+    end if
+
+  end subroutine checked_sum
+
+end module threaded_abort
@@ -19,108 +19,316 @@
 #include <Python.h>
 #include <fortranobject.h>
 
+/* Maximum rank of a Fortran array, and length of the shape array returned by
+   the __array__ routines written by f90wrap.f90wrapgen */
+#define F90WRAP_MAX_RANK 15
+
 // http://python3porting.com/cextensions.html
 #ifndef Py_TYPE
     #define Py_TYPE(ob) (((PyObject*)(ob))->ob_type)
 #endif
 
 
-static PyObject*
-get_array(PyObject *self, PyObject *args)
+/* Convert `this_capi` to an integer(sizeof_fortran_t) array referencing a
+   derived type instance. Returns NULL with a Python exception set on failure.
+   The result should be released with release_handle(). */
+static PyArrayObject*
+handle_from_pyobj(int sizeof_fortran_t, PyObject *this_capi)
 {
-  typedef void (*arrayfunc_t)(int*,int*,int*,int*,void*);
-  typedef void (*arrayfunc_key_t)(int*,char*,int*,int*,int*,void*,int);
-
-  int nd, i, typenum;
-  int dim_temp[10];
-  npy_intp *dimensions;
-  char *data = NULL;
-  PyArrayObject *array = NULL;
-  PyArray_Descr *descr = NULL;
-
-  int *this = NULL;
-  int sizeof_fortran_t;
   npy_intp this_Dims[1] = {-1};
   const int this_Rank = 1;
   PyArrayObject *capi_this_tmp = NULL;
   int capi_this_intent = 0;
-  PyObject *this_capi = NULL;
-  PyFortranObject *arrayfunc_capi = NULL;
-  char *key = NULL;
-
-  if (!PyArg_ParseTuple(args, "iOO|s", &sizeof_fortran_t,&this_capi,&arrayfunc_capi,&key))
-    return NULL;
 
-  /* Processing variable this */
   this_Dims[0]=sizeof_fortran_t;
   capi_this_intent |= F2PY_INTENT_IN;
   capi_this_tmp = array_from_pyobj(PyArray_INT,this_Dims,this_Rank,capi_this_intent,this_capi);
   if (capi_this_tmp == NULL) {
     if (!PyErr_Occurred())
       PyErr_SetString(PyExc_TypeError,"failed in converting 1st argument `this' of get_array to C/Fortran array" );
-    goto fail;
-  } else {
-    this = (int *)(capi_this_tmp->data);
   }
+  return capi_this_tmp;
+}
 
-  /* Processing variable arrayfunc */
+
+static void
+release_handle(PyArrayObject *capi_this_tmp, PyObject *this_capi)
+{
+  if(capi_this_tmp != NULL && ((PyObject *)capi_this_tmp!=this_capi)) {
+    Py_XDECREF(capi_this_tmp);
+  }
+}
+
+
+/* Check that `arrayfunc_capi` is a callable Fortran routine. Returns 0 if
+   it is, or -1 with a Python exception set. */
+static int
+check_arrayfunc(PyFortranObject *arrayfunc_capi)
+{
   if (!PyFortran_Check1(arrayfunc_capi)) {
     PyErr_SetString(PyExc_TypeError, "2nd argument `arrayfunc' is not a fortran object");
-    goto fail;
+    return -1;
   }
   
   if (arrayfunc_capi->defs[0].rank==-1) {/* is Arrayfunc_Capirtran routine */
     if ((arrayfunc_capi->defs[0].func==NULL)) {
       PyErr_Format(PyExc_RuntimeError, "no function to call");
-      goto fail;
+      return -1;
     }
     else if (arrayfunc_capi->defs[0].data==NULL) {
       PyErr_Format(PyExc_TypeError, "fortran object is not callable");
-      goto fail;
+      return -1;
     }
   } else {
     PyErr_Format(PyExc_TypeError, "fortran object is not callable");
-    goto fail;
+    return -1;
   }
+  return 0;
+}
+
+
+/* Call the Fortran array function `arrayfunc_capi` for the derived type
+   instance referenced by `this`, and return the rank, type, shape and
+   address of the array in `nd`, `typenum`, `dimensions` and `data`.
+   `data` is NULL if the array is not allocated. Returns 0 on success, or
+   -1 with a Python exception set. */
+static int
+call_arrayfunc(int *this, PyFortranObject *arrayfunc_capi, char *key,
+               int *nd, int *typenum, npy_intp *dimensions, char **data)
+{
+  typedef void (*arrayfunc_t)(int*,int*,int*,npy_int64*,void*);
+  typedef void (*arrayfunc_key_t)(int*,char*,int*,int*,npy_int64*,void*,int);
+
+  int i;
+  npy_int64 dim_temp[F90WRAP_MAX_RANK];
+
+  if (check_arrayfunc(arrayfunc_capi) < 0)
+    return -1;
 
   /* Call arrayfunc_capi routine */
+  *data = NULL;
   if (key == NULL) 
-    ((arrayfunc_t)(arrayfunc_capi->defs[0].data))(this, &nd, &typenum, dim_temp, &data);
+    ((arrayfunc_t)(arrayfunc_capi->defs[0].data))(this, nd, typenum, dim_temp, data);
   else
-    ((arrayfunc_key_t)(arrayfunc_capi->defs[0].data))(this, key, &nd, &typenum, dim_temp, &data, strlen(key));
+    ((arrayfunc_key_t)(arrayfunc_capi->defs[0].data))(this, key, nd, typenum, dim_temp, data, strlen(key));
 
-  if (data == NULL) {
-    PyErr_SetString(PyExc_ValueError, "array is NULL");
-    goto fail;
+  if (*data == NULL)
+    return 0;
+
+  if (*nd < 0 || *nd > F90WRAP_MAX_RANK || *nd > NPY_MAXDIMS) {
+    PyErr_Format(PyExc_ValueError, "array rank %d not supported", *nd);
+    return -1;
   }
 
-  dimensions = (npy_intp*)malloc(nd*sizeof(npy_intp));
-  for (i=0; i<nd; i++) {
+  for (i=0; i<*nd; i++) {
     dimensions[i] = (npy_intp)(dim_temp[i]);
   }
+  return 0;
+}
+
+
+/* As call_arrayfunc(), but converting the handle `this_capi` first and
+   raising ValueError if the array is not allocated */
+static int
+call_arrayfunc_handle(int sizeof_fortran_t, PyObject *this_capi, PyFortranObject *arrayfunc_capi,
+                      char *key, int *nd, int *typenum, npy_intp *dimensions, char **data)
+{
+  PyArrayObject *capi_this_tmp = NULL;
+  int status;
+
+  capi_this_tmp = handle_from_pyobj(sizeof_fortran_t, this_capi);
+  if (capi_this_tmp == NULL)
+    return -1;
+  status = call_arrayfunc((int *)PyArray_DATA(capi_this_tmp), arrayfunc_capi, key,
+                          nd, typenum, dimensions, data);
+  release_handle(capi_this_tmp, this_capi);
+
+  if (status == 0 && *data == NULL) {
+    PyErr_SetString(PyExc_ValueError, "array is NULL");
+    return -1;
+  }
+  return status;
+}
+
+
+/* Construct an array viewing existing Fortran data. If `owner` is not NULL
+   or None it becomes the base object of the array, so that the object the
+   data belongs to is kept alive for as long as the array. */
+static PyArrayObject*
+new_array_view(int nd, int typenum, npy_intp *dimensions, char *data, PyObject *owner)
+{
+  PyArray_Descr *descr = NULL;
+  PyArrayObject *array = NULL;
 
-  /* Construct array */
-  descr = PyArray_DescrNewFromType(typenum);
+  /* builtin descriptors are shared, so this does not allocate */
+  descr = PyArray_DescrFromType(typenum);
+  if (descr == NULL)
+    return NULL;
   array = (PyArrayObject*) PyArray_NewFromDescr(&PyArray_Type, descr, nd, dimensions, NULL, 
                                                 data, NPY_FORTRAN | NPY_WRITEABLE | NPY_ALIGNED, NULL);
-  free(dimensions);
-  if((PyObject *)capi_this_tmp!=this_capi) {
-    Py_XDECREF(capi_this_tmp);
+  if (array == NULL || owner == NULL || owner == Py_None)
+    return array;
+
+  /* PyArray_SetBaseObject() steals the reference, even on failure */
+  Py_INCREF(owner);
+  if (PyArray_SetBaseObject(array, owner) < 0) {
+    Py_DECREF(array);
+    return NULL;
+  }
+  return array;
+}
+
+
+static PyObject*
+get_array(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static char *kwlist[] = {"sizeof_fortran_t", "this", "arrayfunc", "key", "owner", NULL};
+  int nd, typenum;
+  npy_intp dimensions[F90WRAP_MAX_RANK];
+  char *data = NULL;
+  int sizeof_fortran_t;
+  PyObject *this_capi = NULL;
+  PyFortranObject *arrayfunc_capi = NULL;
+  char *key = NULL;
+  PyObject *owner = NULL;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "iOO|zO", kwlist, &sizeof_fortran_t,&this_capi,
+                                   &arrayfunc_capi,&key,&owner))
+    return NULL;
+
+  if (call_arrayfunc_handle(sizeof_fortran_t, this_capi, arrayfunc_capi, key,
+                            &nd, &typenum, dimensions, &data) < 0)
+    return NULL;
+
+  return (PyObject *)new_array_view(nd, typenum, dimensions, data, owner);
+}
+
+
+static PyObject*
+get_array_cached(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static char *kwlist[] = {"sizeof_fortran_t", "this", "arrayfunc", "cache", "key", "owner", NULL};
+  int nd, typenum, i;
+  npy_intp dimensions[F90WRAP_MAX_RANK];
+  char *data = NULL;
+  int sizeof_fortran_t;
+  PyObject *this_capi = NULL;
+  PyFortranObject *arrayfunc_capi = NULL;
+  PyObject *cache = NULL;
+  char *key = NULL;
+  PyObject *address = NULL;
+  PyArrayObject *array = NULL;
+  PyObject *owner = NULL;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "iOOO!|zO", kwlist, &sizeof_fortran_t,&this_capi,
+                                   &arrayfunc_capi,&PyDict_Type,&cache,&key,&owner))
+    return NULL;
+
+  if (call_arrayfunc_handle(sizeof_fortran_t, this_capi, arrayfunc_capi, key,
+                            &nd, &typenum, dimensions, &data) < 0)
+    return NULL;
+
+  address = PyLong_FromVoidPtr(data);
+  if (address == NULL)
+    return NULL;
+
+  /* Reuse the cached view if it still matches the Fortran array */
+  array = (PyArrayObject *)PyDict_GetItem(cache, address);
+  if (array != NULL && PyArray_Check(array) && PyArray_DATA(array) == (void *)data &&
+      PyArray_NDIM(array) == nd && PyArray_DESCR(array)->type_num == typenum) {
+    for (i=0; i<nd; i++) {
+      if (PyArray_DIMS(array)[i] != dimensions[i])
+        break;
+    }
+    if (i == nd) {
+      Py_DECREF(address);
+      Py_INCREF(array);
+      return (PyObject *)array;
+    }
+  }
+
+  array = new_array_view(nd, typenum, dimensions, data, owner);
+  if (array == NULL || PyDict_SetItem(cache, address, (PyObject *)array) < 0) {
+    Py_XDECREF(array);
+    Py_DECREF(address);
+    return NULL;
   }
+  Py_DECREF(address);
   return (PyObject *)array;
+}
 
- fail:
-  Py_XDECREF(descr);
-  if(capi_this_tmp != NULL && ((PyObject *)capi_this_tmp!=this_capi)) {
-    Py_XDECREF(capi_this_tmp);
+
+static PyObject*
+get_arrays(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static char *kwlist[] = {"sizeof_fortran_t", "this", "arrayfuncs", "owner", NULL};
+  int nd, typenum;
+  npy_intp dimensions[F90WRAP_MAX_RANK];
+  char *data = NULL;
+  int sizeof_fortran_t;
+  PyObject *this_capi = NULL;
+  PyObject *arrayfuncs = NULL;
+  PyObject *fast_arrayfuncs = NULL;
+  PyObject *result = NULL;
+  PyObject *item = NULL;
+  PyArrayObject *capi_this_tmp = NULL;
+  Py_ssize_t i, n;
+  PyObject *owner = NULL;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "iOO|O", kwlist, &sizeof_fortran_t,&this_capi,
+                                   &arrayfuncs,&owner))
+    return NULL;
+
+  fast_arrayfuncs = PySequence_Fast(arrayfuncs, "3rd argument `arrayfuncs' must be a sequence");
+  if (fast_arrayfuncs == NULL)
+    return NULL;
+
+  /* the handle is converted only once for all the arrays */
+  capi_this_tmp = handle_from_pyobj(sizeof_fortran_t, this_capi);
+  if (capi_this_tmp == NULL)
+    goto fail;
+
+  n = PySequence_Fast_GET_SIZE(fast_arrayfuncs);
+  result = PyList_New(n);
+  if (result == NULL)
+    goto fail;
+
+  for (i=0; i<n; i++) {
+    if (call_arrayfunc((int *)PyArray_DATA(capi_this_tmp),
+                       (PyFortranObject *)PySequence_Fast_GET_ITEM(fast_arrayfuncs, i), NULL,
+                       &nd, &typenum, dimensions, &data) < 0)
+      goto fail;
+    if (data == NULL) {
+      /* not allocated */
+      Py_INCREF(Py_None);
+      item = Py_None;
+    } else {
+      item = (PyObject *)new_array_view(nd, typenum, dimensions, data, owner);
+      if (item == NULL)
+        goto fail;
+    }
+    PyList_SET_ITEM(result, i, item);
   }
+
+  release_handle(capi_this_tmp, this_capi);
+  Py_DECREF(fast_arrayfuncs);
+  return result;
+
+ fail:
+  Py_XDECREF(result);
+  release_handle(capi_this_tmp, this_capi);
+  Py_DECREF(fast_arrayfuncs);
   return NULL;
 }
 
 
 static PyMethodDef arraydata_methods[] = {
-  {"get_array", get_array, METH_VARARGS, 
-   "Make an array from integer(sizeof_fortran_t) array containing reference to derived type object,\n and fortran array function.\n\get_array(sizeof_fortran_t, fpointer,array_fobj[,key]) -> array"},
+  {"get_array", (PyCFunction)get_array, METH_VARARGS | METH_KEYWORDS, 
+   "Make an array from integer(sizeof_fortran_t) array containing reference to derived type object,\n and fortran array function. If `owner` is given it becomes the base object of the array,\n keeping it alive for as long as the array.\nget_array(sizeof_fortran_t, fpointer,array_fobj[,key,owner]) -> array"},
+  {"get_array_cached", (PyCFunction)get_array_cached, METH_VARARGS | METH_KEYWORDS, 
+   "As get_array(), but return the array stored in dictionary `cache` under the address of the data\n if its shape and type still match the Fortran array, and store new arrays in `cache`.\nget_array_cached(sizeof_fortran_t, fpointer,array_fobj,cache[,key,owner]) -> array"},
+  {"get_arrays", (PyCFunction)get_arrays, METH_VARARGS | METH_KEYWORDS, 
+   "As get_array(), for each of a sequence of fortran array functions of the same derived type object.\n Arrays which are not allocated are returned as None.\nget_arrays(sizeof_fortran_t, fpointer,array_fobjs[,owner]) -> list of arrays"},
   {NULL, NULL}
 };
 
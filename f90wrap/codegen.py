@@ -16,6 +16,66 @@
 # HF X
 # HF XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 
+import logging
+import os
+import tempfile
+
+
+def write_if_changed(path, text):
+    """
+    Write `text` to the file `path`, unless it already contains exactly
+    `text`, in which case the file is left untouched so that its timestamp
+    does not trigger needless recompilation.
+
+    The new contents are written to a temporary file in the same directory
+    which is then renamed to `path`, so the file is never seen half written.
+
+    Returns True if the file was written, False if it was already up to date.
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == text:
+                logging.info('%s is unchanged, not rewriting it' % path)
+                return False
+    dirname, basename = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=dirname or '.', prefix='.' + basename, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        # mkstemp() creates private files: use the usual permissions instead
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return True
+
+
+class OutputFile(object):
+    """
+    File-like object for generated code. Text written to it is buffered and
+    only saved to disk by `close()`, using `write_if_changed()`.
+
+    Parameters
+    ----------
+    path : `str`
+        Name of the file to write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = []
+
+    def write(self, text):
+        self.chunks.append(text)
+
+    def close(self):
+        return write_if_changed(self.path, ''.join(self.chunks))
+
+
 class CodeGenerator(object):
     """
     Simple class to handle code generation.
@@ -18,15 +18,20 @@
 
 import logging
 import os
+import re
 import warnings
 
 import numpy as np
 
 from f90wrap import codegen as cg
 from f90wrap import fortran as ft
+from f90wrap import incremental
 from f90wrap.six import string_types  # Python 2/3 compatibility library
 from f90wrap.transform import ArrayDimensionConverter
 
+# maximum rank of a Fortran array; must match F90WRAP_MAX_RANK in arraydatamodule.c
+MAX_RANK = 15
+
 
 class F90WrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
     """
@@ -62,10 +67,16 @@ class F90WrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
 
     types: `dict`
         Dictionary mapping type names to Fortran modules where they are defined
+
+    signatures : `dict`, optional
+        Module signatures from `f90wrap.incremental.module_signatures()`. If
+        given, wrapper files whose modules all have the same signatures as
+        when the file was last written are neither regenerated nor touched.
     """
 
     def __init__(self, prefix, sizeof_fortran_t, string_lengths, abort_func,
-                 kind_map, types, default_to_inout, dest = '.'):
+                 kind_map, types, default_to_inout, dest = '.', signatures=None,
+                 batch=None):
         cg.CodeGenerator.__init__(self, indent=' ' * 4,
                                   max_length=156,
                                   continuation='&',
@@ -81,36 +92,91 @@ class F90WrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
         self.dest = os.path.abspath(dest)
         if not os.path.exists(dest):
             os.mkdir(dest)
+        self.signatures = signatures
+        self.unchanged_files = set()
+        self.wrapper_files = {}
+        if batch is None:
+            batch = []
+        self.batch = set([name.lower() for name in batch])
     
-    def open_file(self, name, mode):
-        path = os.path.join(self.dest, name)
-        _file = open(path, mode)
-        return _file        
+    def open_file(self, name, mode='w'):
+        """
+        Open the output file `name` for writing. The file is only replaced,
+        atomically, when it is closed and only if its contents have changed.
+        """
+        if mode != 'w':
+            raise ValueError('output files can only be opened in mode "w"')
+        return cg.OutputFile(os.path.join(self.dest, name))
+
+    def wrapper_file_name(self, mod):
+        """
+        Name of the wrapper file for module `mod`: one file is written per
+        source file, named after it.
+        """
+        return '%s%s.f90' % (self.prefix, os.path.splitext(os.path.basename(mod.filename))[0])
+
+    def find_unchanged_files(self, node, top_level_wrapper_file):
+        """
+        Return the names of the wrapper files which do not need to be
+        regenerated, and the manifest updated with the signatures of all
+        wrapper files in this tree.
+        """
+        manifest = incremental.read_manifest(self.dest)
+        file_modules = {}
+        for mod in node.modules:
+            file_modules.setdefault(self.wrapper_file_name(mod), []).append(mod.name)
+        file_signatures = dict((name, incremental.combine_signatures(
+                                    [self.signatures[mod_name] for mod_name in mod_names]))
+                               for (name, mod_names) in file_modules.items())
+        file_signatures[top_level_wrapper_file] = self.signatures[incremental.TOPLEVEL]
+
+        unchanged_files = set()
+        for name, signature in file_signatures.items():
+            if (manifest.get(name) == signature and
+                    os.path.exists(os.path.join(self.dest, name))):
+                logging.info('F90WrapperGenerator: %s is up to date' % name)
+                unchanged_files.add(name)
+        manifest.update(file_signatures)
+        return unchanged_files, manifest
 
     def visit_Root(self, node):
         """
         Write a wrapper for top-level procedures.
         """
-        # clean up any previous wrapper files
         top_level_wrapper_file = '%s%s.f90' % (self.prefix, 'toplevel')
-        f90_wrapper_files = (['%s%s.f90' % (self.prefix,
-                                            os.path.splitext(os.path.basename(mod.filename))[0])
-                              for mod in node.modules] +
-                             [top_level_wrapper_file])
-
-        for f90_wrapper_file in f90_wrapper_files:
-            temp = os.path.join(self.dest, f90_wrapper_file)
-            if os.path.exists(temp):
-                os.unlink(temp)
-                if f90_wrapper_file != top_level_wrapper_file:
-                    open(temp, 'w').close()  #clear
+        if self.signatures is not None:
+            self.unchanged_files, manifest = self.find_unchanged_files(node, top_level_wrapper_file)
+
+        # code for each wrapper file is collected here and written at the end,
+        # so that files whose contents have not changed are left untouched
+        self.wrapper_files = {}
+        for mod in node.modules:
+            if self.wrapper_file_name(mod) not in self.unchanged_files:
+                self.wrapper_files[self.wrapper_file_name(mod)] = []
+
         self.code = []
         self.generic_visit(node)
-        if len(self.code) > 0:
-            f90_wrapper_file = self.open_file(top_level_wrapper_file, 'w')
-            f90_wrapper_file.write(str(self))
+
+        for name, chunks in self.wrapper_files.items():
+            f90_wrapper_file = self.open_file(name)
+            for chunk in chunks:
+                f90_wrapper_file.write(chunk)
             f90_wrapper_file.close()
 
+        if top_level_wrapper_file not in self.unchanged_files:
+            if len(self.code) > 0:
+                f90_wrapper_file = self.open_file(top_level_wrapper_file)
+                f90_wrapper_file.write(str(self))
+                f90_wrapper_file.close()
+            else:
+                # clean up any previous wrapper file
+                temp = os.path.join(self.dest, top_level_wrapper_file)
+                if os.path.exists(temp):
+                    os.unlink(temp)
+
+        if self.signatures is not None:
+            incremental.write_manifest(self.dest, manifest)
+
     def visit_Module(self, node):
         """
         Wrap modules. Each Fortran module generates one wrapper source file.
@@ -118,6 +184,8 @@ class F90WrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
         Subroutines and elements within each module are properly wrapped.
         """
         logging.info('F90WrapperGenerator visiting module %s' % node.name)
+        if self.wrapper_file_name(node) in self.unchanged_files:
+            return
         self.code = []
         self.write('! Module %s defined in file %s' % (node.name, node.filename))
         self.write()
@@ -136,12 +204,10 @@ class F90WrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
         self.write('! End of module %s defined in file %s' % (node.name, node.filename))
         self.write()
         if len(self.code) > 0:
-            f90_wrapper_name = '%s%s.f90' % (self.prefix, os.path.splitext(os.path.basename(node.filename))[0])
-            if os.path.exists(f90_wrapper_name):
+            chunks = self.wrapper_files[self.wrapper_file_name(node)]
+            if chunks:
                 warnings.warn('Source file %s contains code for more than one module!' % node.filename)
-            f90_wrapper_file = self.open_file(f90_wrapper_name, 'a')
-            f90_wrapper_file.write(str(self))
-            f90_wrapper_file.close()
+            chunks.append(str(self))
         self.code = []
 
     def write_uses_lines(self, node, extra_uses_dict=None):
@@ -155,7 +221,11 @@ class F90WrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
         all_uses = {}
         node_uses = []
         if hasattr(node, 'uses'):
-            for use in node.uses:
+            uses = node.uses
+            if isinstance(uses, set):
+                # sort so that regenerated files are identical
+                uses = sorted(uses, key=str)
+            for use in uses:
                 if isinstance(use, string_types):
                     node_uses.append((use, None))
                 else:
@@ -180,14 +250,20 @@ class F90WrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
                     
         def get_name(name):
             if '=>' in name or \
-                 name == node.name and (isinstance(node, ft.Function) or isinstance(node, ft.Subroutine)):
+                 name in (node.name, getattr(node, 'call_name', None)) and \
+                 (isinstance(node, ft.Function) or isinstance(node, ft.Subroutine)):
                 return name
             else:
                 return  'type_%s=>%s' %(name, name)
 
         for mod, only in all_uses.items():
             if only is not None:
-                temp = [get_name(bb) for bb in set(only)]  # YANN: "set" to avoid derundancy
+                # YANN: skip repeated symbols to avoid redundancy, keeping
+                # the order stable so that regenerated files are identical
+                temp = []
+                for bb in only:
+                    if get_name(bb) not in temp:
+                        temp.append(get_name(bb))
                 self.write('use %s, only: %s' % (mod, ', '.join(temp)))
             else:
                 self.write('use %s' % mod)
@@ -289,9 +365,13 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
             else:
                 self.write(exe % D)
 
-    def write_call_lines(self, node, func_name):
+    def write_call_lines(self, node, func_name, index=None):
         """
         Write line that calls a single wrapped Fortran routine
+
+        If `index` is given, every argument is an array with an extra
+        leading dimension, and the routine is called with the slices of
+        the arguments at `index` along that dimension.
         """
         if 'skip_call' in node.attributes:
             return
@@ -312,6 +392,10 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
                 name += '_ptr%p'
             if 'super-type' in arg.doc:
                 name += '%items'
+            if index is not None:
+                dims = [attr for attr in arg.attributes if attr.startswith('dimension')]
+                rank = dims and len(ArrayDimensionConverter.split_dimensions(dims[0])) or 0
+                name += '(%s)' % ', '.join([index] + [':'] * rank)
             return name
 
         if node.mod_name is not None:
@@ -379,7 +463,7 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
                 self.write('%s %s' % (node.orig_node.ret_val.type, node.name))
 
         self.write()
-        for tname in node.types:
+        for tname in sorted(node.types):
             if 'super-type' in self.types[tname].doc:
                 self.write_super_type_lines(self.types[tname])
             self.write_type_lines(tname)
@@ -392,8 +476,103 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
         self.dedent()
         self.write("end subroutine %(sub_name)s" % {'sub_name': self.prefix + node.name})
         self.write()
+        if node.name.lower() in self.batch:
+            if ft.is_batchable(node):
+                self.write_batch_wrapper(node, call_name)
+            else:
+                logging.warning('cannot write batch wrapper for routine %s: only routines with '
+                                'intrinsic scalar and array arguments can be batched' % node.name)
+        if ft.is_broadcastable(node):
+            self.write_elemental_wrapper(node, call_name)
         return self.generic_visit(node)
 
+    def write_elemental_wrapper(self, node, call_name):
+        """
+        Write a wrapper which applies an elemental subroutine or function to
+        whole arrays with a single call
+
+        Every argument of the elemental wrapper is a one-dimensional array
+        of the same size, which the Python wrapper fills with the flattened
+        inputs after broadcasting them against one another.
+        """
+        n = self.prefix + 'n'
+        sub_name = self.prefix + node.name + '_elemental'
+        first = [arg for arg in node.arguments if 'intent(out)' not in arg.attributes][0]
+
+        self.write('subroutine %s(%s)' % (sub_name, ', '.join([arg.name for arg in node.arguments] +
+                                                             [n])))
+        self.indent()
+        self.write_uses_lines(node)
+        self.write('implicit none')
+        self.write()
+        for arg in node.arguments:
+            attributes = [attr for attr in arg.attributes if attr in ('intent(in)', 'intent(out)')]
+            attributes.append('dimension(%s)' % n)
+            self.write('%s, %s :: %s' % (arg.type, ', '.join(attributes), arg.name))
+        self.write('integer :: %s' % n)
+        self.write('!f2py intent(hide), depend(%s) :: %s = len(%s)' % (first.name, n, first.name))
+        self.write()
+        self.write_call_lines(node, call_name)
+        self.dedent()
+        self.write('end subroutine %s' % sub_name)
+        self.write()
+
+    def write_batch_wrapper(self, node, call_name):
+        """
+        Write a wrapper which calls a Fortran subroutine or function once
+        for each item of a batch of inputs, in a single loop
+
+        Every argument of the batch wrapper has an extra leading dimension,
+        the size of the batch, along which the inputs and outputs of each
+        call are stacked.
+        """
+        nbatch = self.prefix + 'nbatch'
+        index = self.prefix + 'i'
+        sub_name = self.prefix + node.name + '_batch'
+        args = [arg for arg in node.arguments if 'intent(hide)' not in arg.attributes]
+        first = [arg for arg in args if 'intent(out)' not in arg.attributes][0]
+
+        self.write('subroutine %s(%s)' % (sub_name, ', '.join([arg.name for arg in node.arguments] +
+                                                             [nbatch])))
+        self.indent()
+        self.write_uses_lines(node)
+        self.write('implicit none')
+        if node.mod_name is None:
+            self.write('external %s' % call_name)
+            if hasattr(node, 'orig_node') and isinstance(node.orig_node, ft.Function):
+                self.write('%s %s' % (node.orig_node.ret_val.type, node.name))
+        self.write()
+        for arg in node.arguments:
+            if 'intent(hide)' in arg.attributes:
+                # array dimensions, now counted from the second one
+                self.write('%s :: %s' % (arg.type, arg.name))
+                if hasattr(arg, 'f2py_line'):
+                    self.write(re.sub(r'shape\((\w+),(\d+)\)',
+                                      lambda m: 'shape(%s,%d)' % (m.group(1), int(m.group(2)) + 1),
+                                      arg.f2py_line))
+                continue
+            attributes = [attr for attr in arg.attributes if attr in ('intent(in)', 'intent(out)',
+                                                                      'intent(inout)')]
+            dims = [nbatch]
+            for attr in arg.attributes:
+                if attr.startswith('dimension'):
+                    dims.extend(ArrayDimensionConverter.split_dimensions(attr))
+            attributes.append('dimension(%s)' % ','.join(dims))
+            self.write('%s, %s :: %s' % (arg.type, ', '.join(attributes), arg.name))
+        self.write('integer :: %s' % nbatch)
+        self.write('!f2py intent(hide), depend(%s) :: %s = shape(%s,0)' % (first.name, nbatch,
+                                                                          first.name))
+        self.write('integer :: %s' % index)
+        self.write()
+        self.write('do %s = 1, %s' % (index, nbatch))
+        self.indent()
+        self.write_call_lines(node, call_name, index)
+        self.dedent()
+        self.write('end do')
+        self.dedent()
+        self.write('end subroutine %s' % sub_name)
+        self.write()
+
     def visit_Type(self, node):
         """
         Properly wraps derived types, including derived-type arrays.
@@ -409,6 +588,9 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
             else:
                 self._write_sc_array_wrapper(node, el, dims[0], self.sizeof_fortran_t)
 
+        if ft.record_elements(self.types[node.name], self.kind_map) is not None:
+            self._write_record_layout(node, self.sizeof_fortran_t)
+
         return self.generic_visit(node)
 
     def _write_sc_array_wrapper(self, t, el, dims, sizeof_fortran_t):
@@ -459,7 +641,7 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
                 rank += 1
         except ValueError:
             rank = 1
-        self.write('integer, dimension(10), intent(out) :: dshape')
+        self.write('integer*8, dimension(%d), intent(out) :: dshape' % MAX_RANK)
         self.write('integer*%d, intent(out) :: dloc' % np.dtype('O').itemsize)
         self.write()
         self.write('nd = %d' % rank)
@@ -475,9 +657,10 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
             self.indent()
         if el.type.startswith('character'):
             first = ','.join(['1' for i in range(rank - 1)])
-            self.write('dshape(1:%d) = (/len(%s(%s)), shape(%s)/)' % (rank, array_name, first, array_name))
+            self.write('dshape(1:%d) = (/int(len(%s(%s)), 8), shape(%s, kind=8)/)' % (rank, array_name,
+                                                                                   first, array_name))
         else:
-            self.write('dshape(1:%d) = shape(%s)' % (rank, array_name))
+            self.write('dshape(1:%d) = shape(%s, kind=8)' % (rank, array_name))
         self.write('dloc = loc(%s)' % array_name)
         if 'allocatable' in el.attributes:
             self.dedent()
@@ -516,6 +699,20 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
         self._write_array_getset_item(t, element, sizeof_fortran_t, 'get')
         self._write_array_getset_item(t, element, sizeof_fortran_t, 'set')
         self._write_array_len(t, element, sizeof_fortran_t)
+        if (ft.record_elements(self.types[element.type], self.kind_map) is not None and
+                'pointer' not in element.attributes):
+            self._write_array_address(t, element, sizeof_fortran_t)
+        for field, gather_name, scatter_name in ft.bulk_access_routines(
+                t, element, self.types[element.type], self.prefix):
+            if len(scatter_name) > ft.max_name_length:
+                logging.warning('not writing bulk access routines for %s%%%s%%%s: %s is longer '
+                                'than %d characters' % (t.name, element.name, field.name,
+                                                        scatter_name, ft.max_name_length))
+                continue
+            self._write_array_gather_scatter(t, element, field, gather_name,
+                                             sizeof_fortran_t, 'gather')
+            self._write_array_gather_scatter(t, element, field, scatter_name,
+                                             sizeof_fortran_t, 'scatter')
 
     def _write_scalar_wrappers(self, t, element, sizeof_fortran_t):
         """
@@ -578,7 +775,7 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
         elif isinstance(t, ft.Type):
             if 'super-type' in t.doc:
                 # YANN: propagate parameter uses
-                for use in t.uses:
+                for use in sorted(t.uses, key=str):
                     if use[0] in extra_uses and use[1][0] not in extra_uses[use[0]]:
                         extra_uses[use[0]].append(use[1][0])
                     else:
@@ -649,6 +846,237 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
                                                               getset, el.name))
         self.write()
 
+    def _write_array_gather_scatter(self, t, el, field, sub_name, sizeof_fortran_t, direction):
+        """
+        Write a subroutine to copy one scalar field of every item in a
+        derived-type array to or from an intrinsic array.
+
+        Parameters
+        ----------
+        t : `fortran.Type` node or `fortran.Module` node
+            Node of the parse tree which contains this derived-type as an element
+
+        el : `fortran.Element` node
+            An element of a module which is derived-type array
+
+        field : `fortran.Element` node
+            Scalar element of the derived type of `el` to copy
+
+        sub_name : `str`
+            Name of the subroutine, from `fortran.bulk_access_routines()`
+
+        sizeof_fortan_t : `int`
+            The size, in bytes, of a pointer to a fortran derived type ??
+
+        direction : `str` {``"gather"``,``"scatter"``}
+            String indicating whether to copy values out of or in to the array.
+        """
+        inout = "in"
+        if direction == "gather":
+            inout = "out"
+
+        if isinstance(t, ft.Type):
+            this = self.prefix + 'this'
+        else:
+            this = 'dummy_this'
+        safe_n = self.prefix + 'n'
+        values = self.prefix + 'values'
+
+        self.write('subroutine %s(%s, %s, %s)' % (sub_name, this, values, safe_n))
+        self.indent()
+        self.write()
+        extra_uses = {}
+        if isinstance(t, ft.Module):
+            extra_uses[t.name] = ['%s_%s => %s' % (t.name, el.name, el.name)]
+        elif isinstance(t, ft.Type):
+            if 'super-type' in t.doc:
+                for use in sorted(t.uses, key=str):
+                    if use[0] in extra_uses and use[1][0] not in extra_uses[use[0]]:
+                        extra_uses[use[0]].append(use[1][0])
+                    else:
+                        extra_uses[use[0]] = [use[1][0]]
+            else:
+                extra_uses[t.mod_name] = [t.name]
+        mod = self.types[el.type].mod_name
+        el_tname = ft.strip_type(el.type)
+        if mod in extra_uses:
+            extra_uses[mod].append(el_tname)
+        else:
+            extra_uses[mod] = [el_tname]
+        self.write_uses_lines(el, extra_uses)
+        self.write('implicit none')
+        self.write()
+
+        if 'super-type' in t.doc:
+            self.write_super_type_lines(t)
+        if isinstance(t, ft.Type):
+            self.write_type_lines(t.name)
+
+        self.write('integer, intent(in) :: %s(%d)' % (this, sizeof_fortran_t))
+        if isinstance(t, ft.Type):
+            self.write('type(%s_ptr_type) :: this_ptr' % t.name)
+            array_name = 'this_ptr%%p%%%s' % el.name
+        else:
+            array_name = '%s_%s' % (t.name, el.name)
+        self.write('integer, intent(in) :: %s' % safe_n)
+        self.write('%s, intent(%s) :: %s(%s)' % (ft.normalise_type(field.type, self.kind_map),
+                                                inout, values, safe_n))
+        self.write()
+        if isinstance(t, ft.Type):
+            self.write('this_ptr = transfer(%s, this_ptr)' % this)
+
+        if 'allocatable' in el.attributes:
+            self.write('if (allocated(%s)) then' % array_name)
+            self.indent()
+
+        self.write('if (%s /= size(%s)) then' % (safe_n, array_name))
+        self.indent()
+        self.write('call %s("array size mismatch")' % self.abort_func)
+        self.dedent()
+        self.write('else')
+        self.indent()
+        if direction == "gather":
+            self.write('%s = %s%%%s' % (values, array_name, field.name))
+        else:
+            self.write('%s%%%s = %s' % (array_name, field.name, values))
+        self.dedent()
+        self.write('endif')
+
+        if 'allocatable' in el.attributes:
+            self.dedent()
+            self.write('else')
+            self.indent()
+            self.write('call %s("derived type array not allocated")' % self.abort_func)
+            self.dedent()
+            self.write('end if')
+
+        self.dedent()
+        self.write('end subroutine %s' % sub_name)
+        self.write()
+
+    def _write_record_layout(self, t, sizeof_fortran_t):
+        """
+        Write subroutines returning the memory layout of a derived type made
+        only of fixed size intrinsic elements, and the address of an instance.
+
+        The offset of each element and the size of the type, including any
+        padding, are found from differences between `loc()` addresses.
+
+        Parameters
+        ----------
+        t : `fortran.Type` node
+            Derived-type node of the parse tree.
+
+        sizeof_fortan_t : `int`
+            The size, in bytes, of a pointer to a fortran derived type ??
+        """
+        address_kind = np.dtype('O').itemsize
+        items = self.prefix + 'items'
+        offsets = self.prefix + 'offsets'
+        itemsize = self.prefix + 'itemsize'
+
+        self.write('subroutine %s%s__record_layout(%s, %s)' % (self.prefix, t.name, offsets, itemsize))
+        self.indent()
+        self.write_uses_lines(t, {t.mod_name: [t.name]})
+        self.write('implicit none')
+        self.write('type(type_%s), target :: %s(2)' % (t.name, items))
+        self.write('integer*%d, intent(out) :: %s(%d)' % (address_kind, offsets, len(t.elements)))
+        self.write('integer*%d, intent(out) :: %s' % (address_kind, itemsize))
+        self.write()
+        for i, el in enumerate(t.elements):
+            self.write('%s(%d) = loc(%s(1)%%%s) - loc(%s(1))' % (offsets, i + 1, items, el.orig_name, items))
+        self.write('%s = loc(%s(2)) - loc(%s(1))' % (itemsize, items, items))
+        self.dedent()
+        self.write('end subroutine %s%s__record_layout' % (self.prefix, t.name))
+        self.write()
+
+        self.write('subroutine %s%s__record_address(this, dloc)' % (self.prefix, t.name))
+        self.indent()
+        self.write_uses_lines(t, {t.mod_name: [t.name]})
+        self.write('implicit none')
+        self.write_type_lines(t.name)
+        self.write('integer, intent(in) :: this(%d)' % sizeof_fortran_t)
+        self.write('type(%s_ptr_type) :: this_ptr' % t.name)
+        self.write('integer*%d, intent(out) :: dloc' % address_kind)
+        self.write()
+        self.write('this_ptr = transfer(this, this_ptr)')
+        self.write('dloc = loc(this_ptr%p)')
+        self.dedent()
+        self.write('end subroutine %s%s__record_address' % (self.prefix, t.name))
+        self.write()
+
+    def _write_array_address(self, t, el, sizeof_fortran_t):
+        """
+        Write a subroutine which returns the address of the first item of a
+        derived-type array, or zero if the array is empty or not allocated.
+
+        Parameters
+        ----------
+        t : `fortran.Type` node or `fortran.Module` node
+            Node of the parse tree which contains this derived-type as an element
+
+        el : `fortran.Element` node
+            An element of a module which is derived-type array
+
+        sizeof_fortan_t : `int`
+            The size, in bytes, of a pointer to a fortran derived type ??
+        """
+        if isinstance(t, ft.Type):
+            this = self.prefix + 'this'
+        else:
+            this = 'dummy_this'
+
+        self.write('subroutine %s%s__array_address__%s(%s, dloc)' % (self.prefix, t.name, el.name, this))
+        self.indent()
+        self.write()
+        extra_uses = {}
+        if isinstance(t, ft.Module):
+            extra_uses[t.name] = ['%s_%s => %s' % (t.name, el.name, el.name)]
+        elif isinstance(t, ft.Type):
+            if 'super-type' in t.doc:
+                for use in sorted(t.uses, key=str):
+                    if use[0] in extra_uses and use[1][0] not in extra_uses[use[0]]:
+                        extra_uses[use[0]].append(use[1][0])
+                    else:
+                        extra_uses[use[0]] = [use[1][0]]
+            else:
+                extra_uses[t.mod_name] = [t.name]
+        mod = self.types[el.type].mod_name
+        el_tname = ft.strip_type(el.type)
+        if mod in extra_uses:
+            extra_uses[mod].append(el_tname)
+        else:
+            extra_uses[mod] = [el_tname]
+        self.write_uses_lines(el, extra_uses)
+        self.write('implicit none')
+        self.write()
+        if 'super-type' in t.doc:
+            self.write_super_type_lines(t)
+        if isinstance(t, ft.Type):
+            self.write_type_lines(t.name)
+        self.write('integer, intent(in) :: %s(%d)' % (this, sizeof_fortran_t))
+        self.write('integer*%d, intent(out) :: dloc' % np.dtype('O').itemsize)
+        if isinstance(t, ft.Type):
+            self.write('type(%s_ptr_type) :: this_ptr' % t.name)
+            self.write()
+            self.write('this_ptr = transfer(%s, this_ptr)' % this)
+            array_name = 'this_ptr%%p%%%s' % el.name
+        else:
+            array_name = '%s_%s' % (t.name, el.name)
+
+        self.write('dloc = 0')
+        if 'allocatable' in el.attributes:
+            self.write('if (allocated(%s)) then' % array_name)
+            self.indent()
+        self.write('if (size(%s) > 0) dloc = loc(%s(1))' % (array_name, array_name))
+        if 'allocatable' in el.attributes:
+            self.dedent()
+            self.write('end if')
+
+        self.dedent()
+        self.write('end subroutine %s%s__array_address__%s' % (self.prefix, t.name, el.name))
+        self.write()
+
     def _write_array_len(self, t, el, sizeof_fortran_t):
         """
         Write a subroutine which returns the length of a derived-type array
@@ -679,7 +1107,7 @@ end type %(typename)s_ptr_type""" % {'typename': tname})
         elif isinstance(t, ft.Type):
             if 'super-type' in t.doc:
                 # YANN: propagate parameter uses
-                for use in t.uses:
+                for use in sorted(t.uses, key=str):
                     if use[0] in extra_uses and use[1][0] not in extra_uses[use[0]]:
                         extra_uses[use[0]].append(use[1][0])
                     else:
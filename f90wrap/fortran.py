@@ -22,6 +22,7 @@ Arguments etc. A Fortran parse tree will contain only these classes as nodes.
 """
 
 from __future__ import print_function
+import copy
 import logging
 import re
 
@@ -57,6 +58,13 @@ class Fortran(object):
 
     _fields = []
 
+    # Nodes keep their attributes in slots rather than a per-instance
+    # __dict__ to keep large trees compact. Slots are also declared for the
+    # optional fields which only some transformations set, such as
+    # `orig_name`: these are left unset until then, so hasattr() can still be
+    # used to check for them.
+    __slots__ = ('name', 'filename', 'doc', 'lineno', 'orig_name')
+
     def __init__(self, name='', filename='', doc=None,
                  lineno=0):
         self.name = name
@@ -66,29 +74,68 @@ class Fortran(object):
         self.doc = doc
         self.lineno = lineno
 
+    # pickle and copy only the fields which are set, so optional fields
+    # stay unset in the new node
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in _slot_names(type(self))
+                    if hasattr(self, name))
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __deepcopy__(self, memo):
+        cls = type(self)
+        node = memo[id(self)] = cls.__new__(cls)
+        for name in _slot_names(cls):
+            try:
+                value = getattr(self, name)
+            except AttributeError:
+                continue
+            setattr(node, name, copy.deepcopy(value, memo))
+        return node
+
     def __repr__(self):
         return '%s(name=%s)' % (self.__class__.__name__, self.name)
 
     def __eq__(self, other):
-        # FIXME: could not we use getattr here to simplify all cases?
         if other is None: return False
-        attrs = [el for el in self.__dict__ if not el.startswith("_")]
-        ret = True
         if type(other) != type(self):
             return False
-        for a in attrs:
+        # compare fields in slot order, so that mismatched names are usually
+        # found straight away
+        for a in _slot_names(type(self)):
             try:
-                ret = ret and getattr(self, a) == getattr(other, a)
+                value = getattr(self, a)
+            except AttributeError:
+                continue  # optional field which is not set
+            try:
+                if not value == getattr(other, a):
+                    return False
             except:
                 return False
-            if not ret:
-                return False
         return True
 
     def __neq__(self, other):
         return not self.__eq__(other)
 
 
+_slot_names_cache = {}
+
+def _slot_names(cls):
+    """
+    Names of all the slots of node class `cls`, including inherited ones.
+    """
+    try:
+        return _slot_names_cache[cls]
+    except KeyError:
+        names = []
+        for klass in reversed(cls.__mro__):
+            names.extend(klass.__dict__.get('__slots__', ()))
+        _slot_names_cache[cls] = names
+        return names
+
+
 class Root(Fortran):
     """
     programs : `list` of `fortran.Program`, default ``None``
@@ -102,6 +149,7 @@ class Root(Fortran):
     """
     __doc__ = _rep_des(Fortran.__doc__, "The Root node of a Fortan parse tree") + __doc__
     _fields = ['programs', 'modules', 'procedures']
+    __slots__ = ('programs', 'modules', 'procedures')
 
     def __init__(self, name='', filename='', doc=None, lineno=0,
                  programs=None, modules=None, procedures=None):
@@ -124,6 +172,7 @@ class Program(Fortran):
     """
     __doc__ = _rep_des(Fortran.__doc__, "Class to represent a Fortran main program.") + __doc__
     _fields = ['procedures']
+    __slots__ = ('procedures', 'uses')
 
     def __init__(self, name='', filename='', doc=None, lineno=0,
                  procedures=None, uses=None):
@@ -166,6 +215,10 @@ class Module(Fortran):
     """
     __doc__ = _rep_des(Fortran.__doc__, "Represents a Fortran module.") + __doc__
     _fields = ['types', 'elements', 'procedures', 'interfaces', 'uses']
+    __slots__ = ('types', 'elements', 'procedures', 'interfaces', 'uses',
+                 'default_access', 'public_symbols', 'private_symbols',
+                 # optional, set by the Python wrapper generator
+                 'array_initialisers', 'dt_array_initialisers')
 
     def __init__(self, name='', filename='', doc=None, lineno=0,
                  types=None, elements=None, procedures=None,
@@ -226,6 +279,12 @@ class Procedure(Fortran):
     """
     __doc__ = _rep_des(Fortran.__doc__, "Represents a Fortran Function or Subroutine.") + __doc__
     _fields = ['arguments']
+    __slots__ = ('arguments', 'uses', 'attributes', 'mod_name', 'type_name',
+                 # optional, set by transformations
+                 'call_name', 'method_name', 'orig_node', 'types',
+                 'allocate', 'deallocate', 'transfer_in', 'transfer_out',
+                 # optional, set when the procedure is a callback argument
+                 'type', 'value', 'py_name', 'py_value')
 
     def __init__(self, name='', filename='', doc=None, lineno=0,
                  arguments=None, uses=None, attributes=None,
@@ -242,7 +301,7 @@ class Procedure(Fortran):
 
 class Subroutine(Procedure):
     __doc__ = _rep_des(Procedure.__doc__, "Represents a Fortran Subroutine.")
-    pass
+    __slots__ = ()
 
 class Function(Procedure):
     """
@@ -254,6 +313,7 @@ class Function(Procedure):
     """
     __doc__ = _rep_des(Procedure.__doc__, "Represents a Fortran Function.") + __doc__
     _fields = ['arguments', 'ret_val']
+    __slots__ = ('ret_val', 'ret_val_doc')
 
     def __init__(self, name='', filename='', doc=None, lineno=0,
                  arguments=None, uses=None, attributes=None,
@@ -269,7 +329,7 @@ class Function(Procedure):
 
 class Prototype(Fortran):
     __doc__ = _rep_des(Fortran.__doc__, "Represents a Fortran Prototype.")
-    pass
+    __slots__ = ()
 
 class Declaration(Fortran):
     """
@@ -284,6 +344,11 @@ class Declaration(Fortran):
         (eg. value=8 in ``"integer :: x = 8"``
     """
     __doc__ = _rep_des(Fortran.__doc__, "Base class representing a declaration statement") + __doc__
+    __slots__ = ('attributes', 'type', 'value',
+                 # optional, set by transformations
+                 'uses', 'py_name', 'py_value', 'f2py_line', 'init_lines',
+                 'wrapper_type', 'wrapper_dim')
+
     def __init__(self, name='', filename='', doc=None, lineno=0,
                  attributes=None, type='', value=''):
         Fortran.__init__(self, name, filename, doc, lineno)
@@ -295,11 +360,11 @@ class Declaration(Fortran):
 
 class Element(Declaration):
     __doc__ = _rep_des(Declaration.__doc__, "Represents a Module or Derived-Type Element.")
-    pass
+    __slots__ = ()
 
 class Argument(Declaration):
     __doc__ = _rep_des(Declaration.__doc__, "Represents a Procedure Argument.")
-    pass
+    __slots__ = ()
 
 class Type(Fortran):
     """
@@ -311,6 +376,10 @@ class Type(Fortran):
     """
     __doc__ = _rep_des(Fortran.__doc__, "Represents a Fortran Derived-type.") + __doc__
     _fields = ['elements', 'procedures', 'interfaces']
+    __slots__ = ('elements', 'procedures', 'interfaces', 'mod_name',
+                 'super_types_dimensions',
+                 # optional, set by the parser and transformations
+                 'uses', 'attributes', 'default_access', 'dt_array_initialisers')
 
     def __init__(self, name='', filename='', doc=None,
                  lineno=0, elements=None, procedures=None, interfaces=None,
@@ -339,6 +408,9 @@ class Interface(Fortran):
     """
     __doc__ = _rep_des(Fortran.__doc__, "Represents a Fortran Interface.") + __doc__
     _fields = ['procedures']
+    __slots__ = ('procedures', 'mod_name', 'type_name',
+                 # optional, set by transformations
+                 'method_name')
 
     def __init__(self, name='', filename='', doc=None,
                  lineno=0, procedures=None, mod_name=None, type_name=None):
@@ -395,23 +467,70 @@ def walk_modules(node):
         if isinstance(child, Module):
             yield child
 
-def find_procedure_module(tree, node):
+class SymbolIndex(object):
     """
-    Find the module in `tree` that contains `node`
+    Index of the modules, derived types, module parameters and module
+    procedures in a parse tree, so that they can be looked up by name
+    without scanning the whole tree.
+
+    The index reflects the tree at the time it was built: a new index
+    should be built after nodes are added, removed or renamed.
+
+    Parameters
+    ----------
+    tree : `fortran.Fortran`
+        Node at which to start indexing, usually a `fortran.Root`.
     """
-    for mod in walk_modules(tree):
-        if node in mod.procedures:
-            return mod
-        for intf in mod.interfaces:
-            if node in intf.procedures:
-                return mod
-        for typ in mod.types:
-            if node in typ.procedures:
+
+    def __init__(self, tree):
+        self.modules = {}      # name -> list of Module
+        self.types = {}        # name -> list of Type
+        self.parameters = {}   # name -> (Module, Element) for first definition
+        self.procedures = {}   # name -> list of (Module, Procedure)
+        for mod in walk_modules(tree):
+            self.modules.setdefault(mod.name, []).append(mod)
+            for el in mod.elements:
+                if 'parameter' in el.attributes:
+                    self.parameters.setdefault(el.name, (mod, el))
+            procedures = list(mod.procedures)
+            for intf in mod.interfaces:
+                procedures.extend(intf.procedures)
+            for typ in mod.types:
+                self.types.setdefault(typ.name, []).append(typ)
+                procedures.extend(typ.procedures)
+                for intf in typ.interfaces:
+                    procedures.extend(intf.procedures)
+            for proc in procedures:
+                self.procedures.setdefault(proc.name, []).append((mod, proc))
+
+    def find_parameter(self, name):
+        """
+        Return a tuple (module, element) for the first module parameter
+        called `name`, or None
+        """
+        return self.parameters.get(name)
+
+    def procedure_module(self, node):
+        """
+        Return the first module containing procedure `node`, either directly
+        or within one of its interfaces or types, or None
+        """
+        for mod, proc in self.procedures.get(node.name, ()):
+            if proc is node or proc == node:
                 return mod
-            for intf in typ.interfaces:
-                if node in intf.procedures:
-                    return mod
-    return None
+        return None
+
+
+def find_procedure_module(tree, node, index=None):
+    """
+    Find the module in `tree` that contains `node`
+
+    If given, `index` should be a `SymbolIndex` of `tree`, which is
+    otherwise built for this query.
+    """
+    if index is None:
+        index = SymbolIndex(tree)
+    return index.procedure_module(node)
 
 
 def walk_procedures(tree, include_ret_val=True):
@@ -421,8 +540,24 @@ def walk_procedures(tree, include_ret_val=True):
 
     If `include_ret_val` is true then Function return values are
     inserted after last non-optional argument.
+
+    The module containing each procedure, directly or within one of its
+    interfaces or types, is tracked during the walk; it is None for
+    procedures outside any module and for callback arguments of other
+    procedures.
     """
-    for node in walk(tree):
+    from collections import deque
+    todo = deque([(tree, tree if isinstance(tree, Module) else None)])
+    while todo:
+        node, mod = todo.popleft()
+        if isinstance(node, Module):
+            child_mod = node
+        elif isinstance(node, Procedure):
+            child_mod = None
+        else:
+            child_mod = mod
+        todo.extend((child, child_mod) for child in iter_child_nodes(node))
+
         if not isinstance(node, Procedure):
             continue
 
@@ -430,8 +565,6 @@ def walk_procedures(tree, include_ret_val=True):
         if include_ret_val and isinstance(node, Function):
             arguments.append(node.ret_val)
 
-        mod = find_procedure_module(tree, node)
-
         yield (mod, node, arguments)
 
 def find(tree, pattern):
@@ -443,6 +576,10 @@ def find(tree, pattern):
             yield node
 
 
+# cache of visitor method names, keyed by (visitor class, node class)
+_visitor_methods = {}
+
+
 class FortranVisitor(object):
     """
     Implementation of the Visitor pattern for a Fortran parse tree.
@@ -454,20 +591,28 @@ class FortranVisitor(object):
     """
 
     def visit(self, node):
-        candidate_methods = ['visit_' + cls.__name__ for cls in
-                             node.__class__.__mro__]
-        for method in candidate_methods:
-            try:
-                visitor = getattr(self, method)
-                break
-            except AttributeError:
-                continue
-        else:
-            visitor = self.generic_visit
+        key = (self.__class__, node.__class__)
+        try:
+            method = _visitor_methods[key]
+        except KeyError:
+            method = _visitor_methods[key] = self.find_visitor_method(node.__class__)
 
-        result = visitor(node)
+        result = getattr(self, method)(node)
         return result
 
+    @classmethod
+    def find_visitor_method(cls, node_class):
+        """
+        Return the name of the method used to visit nodes of class
+        `node_class`: ``visit_`` plus the name of the first class in its MRO
+        for which such a method is defined, or ``generic_visit``.
+        """
+        for node_cls in node_class.__mro__:
+            method = 'visit_' + node_cls.__name__
+            if hasattr(cls, method):
+                return method
+        return 'generic_visit'
+
     def generic_visit(self, node):
         for field, value in iter_fields(node):
             if isinstance(value, list):
@@ -635,6 +780,111 @@ class LowerCaseConverter(FortranTransformer):
         node.attributes = [a.lower() for a in node.attributes]
         return self.generic_visit(node)
 
+def bulk_access_elements(typ):
+    """
+    Return the elements of derived type `typ` which can be gathered from or
+    scattered to arrays of that type in a single Fortran array operation:
+    scalar integer, real, complex and logical elements.
+    """
+    elements = []
+    for el in typ.elements:
+        if (any(attr.startswith('dimension') or attr in ('pointer', 'allocatable')
+                for attr in el.attributes) or
+                not el.type.startswith(('integer', 'real', 'double', 'complex', 'logical'))):
+            continue
+        elements.append(el)
+    return elements
+
+# longest name the Fortran standard allows
+max_name_length = 63
+
+def bulk_access_routines(parent, el, typ, prefix):
+    """
+    Return a list of tuples (field, gather_name, scatter_name) naming the
+    routines which copy each of the `bulk_access_elements()` of derived
+    type `typ` for all the items of the derived type array element `el` of
+    `parent`. Fields are numbered rather than named to keep the names
+    short; callers should still leave out routines with names longer than
+    `max_name_length`.
+    """
+    return [(field,
+             '%s%s__gather__%s__%d' % (prefix, parent.name, el.name, i),
+             '%s%s__scatter__%s__%d' % (prefix, parent.name, el.name, i))
+            for i, field in enumerate(bulk_access_elements(typ))]
+
+def is_batchable(node):
+    """
+    Return True if procedure `node` can be called for a batch of inputs in
+    a single Fortran loop: its arguments, and result if it is a function,
+    must all be integer, real, complex or logical scalars or explicit or
+    assumed shape arrays without the optional, pointer or allocatable
+    attributes, and at least one argument must be an input.
+    """
+    args = [arg for arg in node.arguments if 'intent(hide)' not in arg.attributes]
+    if not any('intent(out)' not in arg.attributes for arg in args):
+        return False
+    if isinstance(node, Function):
+        ret_vals = node.ret_val
+        if not isinstance(ret_vals, list):
+            ret_vals = [ret_vals]
+        args = args + ret_vals
+    for arg in args:
+        if (not arg.type.startswith(('integer', 'real', 'double', 'complex', 'logical')) or
+                any(attr in ('optional', 'pointer', 'allocatable', 'callback', 'value')
+                    for attr in arg.attributes)):
+            return False
+        dims = [attr for attr in arg.attributes if attr.startswith('dimension')]
+        if dims and '*' in dims[0]:
+            return False  # assumed size
+    return True
+
+def is_broadcastable(node):
+    """
+    Return True if procedure `node` is elemental and can be applied to
+    whole arrays of inputs in a single Fortran call: it must be batchable
+    (see `is_batchable()`), be defined in a module, so that it has an
+    explicit interface, and have no intent(inout) arguments, since
+    broadcast inputs are passed to Fortran as flattened copies.
+    """
+    if 'elemental' not in [attr.lower() for attr in node.attributes] or node.mod_name is None:
+        return False
+    if any('intent(inout)' in arg.attributes for arg in node.arguments):
+        return False
+    return is_batchable(node)
+
+def record_elements(typ, kind_map):
+    """
+    If every element of derived type `typ` is a fixed size integer, real,
+    complex or logical scalar or array, instances have a plain memory
+    layout which can be viewed as a numpy structured array. In that case
+    return a list of ``(name, typenum, shape)`` tuples describing the
+    elements, where `typenum` is the numpy type number and `shape` is the
+    Fortran shape of array elements or ``()`` for scalars. Otherwise
+    return None.
+    """
+    if not typ.elements or 'super-type' in typ.doc:
+        return None
+    if any(attr.startswith('extends') for attr in getattr(typ, 'attributes', [])):
+        return None
+    elements = []
+    for el in typ.elements:
+        if (not el.type.startswith(('integer', 'real', 'double', 'complex', 'logical')) or
+                any(attr in ('pointer', 'allocatable', 'private') for attr in el.attributes)):
+            return None
+        shape = ()
+        dims = [attr for attr in el.attributes if attr.startswith('dimension')]
+        if dims:
+            try:
+                shape = tuple(int(dim) for dim in dims[0][len('dimension('):-1].split(','))
+            except ValueError:
+                return None  # deferred or non-literal shape
+        try:
+            typenum = fortran_array_type(el.type, kind_map)
+        except RuntimeError:
+            return None
+        elements.append((el.name, typenum, shape))
+    return elements
+
 def strip_type(t):
     """Return type name from type declaration"""
     t = t.replace(' ', '')  # remove blanks
@@ -1,4 +1,8 @@
+import threading
 import weakref
+from collections import OrderedDict
+
+import numpy as np
 
 
 class Singleton(type):
@@ -10,6 +14,158 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+class FortranObjectCache(object):
+    """
+    Cache of the Python objects wrapping derived type handles, keyed on the
+    raw bytes of each handle.
+
+    Objects are held by weak references, so the cache does not keep them
+    alive on its own. Strong references to the `capacity` most recently
+    used objects over all caches are also kept, in a single list shared by
+    every cache, so that repeated accesses to the same elements in a loop
+    do not create new objects each time, however many parent objects the
+    elements belong to. The objects of a cache are dropped from this list
+    when the cache itself is deleted.
+
+    `hits` and `misses` count lookups over all caches. Calling
+    :func:`clear_caches` empties every cache, including those not yet
+    accessed since.
+    """
+
+    __slots__ = ('_refs', '_generation')
+
+    capacity = 128
+    hits = 0
+    misses = 0
+    _current_generation = 0
+    # most recently used objects of all caches, keyed on their id(), which
+    # is unique for as long as they are kept here
+    _recent = OrderedDict()
+    # guards _recent, which caches used from different threads share. It is
+    # re-entrant as a garbage collection while it is held can delete a
+    # cache, whose clear() then takes it again in the same thread.
+    _lock = threading.RLock()
+
+    def __init__(self):
+        self._refs = None
+        self._generation = FortranObjectCache._current_generation
+
+    def _check_generation(self):
+        if self._generation != FortranObjectCache._current_generation:
+            self._refs = None
+            self._generation = FortranObjectCache._current_generation
+
+    def get(self, key, default=None):
+        self._check_generation()
+        obj = None
+        if self._refs is not None:
+            obj = self._refs.get(key)
+        if obj is None:
+            FortranObjectCache.misses += 1
+            return default
+        FortranObjectCache.hits += 1
+        _keep_recent(obj)
+        return obj
+
+    def __getitem__(self, key):
+        obj = self.get(key)
+        if obj is None:
+            raise KeyError(key)
+        return obj
+
+    def __setitem__(self, key, obj):
+        self._check_generation()
+        if self._refs is None:
+            self._refs = weakref.WeakValueDictionary()
+        self._refs[key] = obj
+        _keep_recent(obj)
+
+    def __contains__(self, key):
+        self._check_generation()
+        return self._refs is not None and key in self._refs
+
+    def __len__(self):
+        self._check_generation()
+        return self._refs is not None and len(self._refs) or 0
+
+    def clear(self):
+        if self._refs is not None:
+            cls = type(self)
+            with cls._lock:
+                dropped = [cls._recent.pop(id(obj), None) for obj in self._refs.values()]
+            del dropped
+        self._refs = None
+
+    # the objects of a cache are not kept alive once its parent has gone
+    __del__ = clear
+
+
+def _keep_recent(obj):
+    """
+    Mark `obj` as the most recently used cached object, dropping the least
+    recently used ones beyond :attr:`FortranObjectCache.capacity`
+    """
+    recent = FortranObjectCache._recent
+    key = id(obj)
+    with FortranObjectCache._lock:
+        recent.pop(key, None)
+        recent[key] = obj
+        dropped = _trim_recent(FortranObjectCache.capacity)
+    del dropped
+
+
+def _trim_recent(capacity):
+    """
+    Remove the least recently used objects beyond `capacity` from the
+    objects kept alive by the caches, and return them. Callers hold
+    `FortranObjectCache._lock`, and release the objects only once they
+    have released the lock, as deleting an object can delete its cache.
+    """
+    recent = FortranObjectCache._recent
+    dropped = []
+    while len(recent) > capacity:
+        dropped.append(recent.popitem(last=False))
+    return dropped
+
+
+def clear_caches():
+    """
+    Drop the cached objects in all instances of :class:`FortranObjectCache`
+    and reset their hit and miss counters
+    """
+    with FortranObjectCache._lock:
+        FortranObjectCache._current_generation += 1
+        dropped = _trim_recent(0)
+        FortranObjectCache.hits = 0
+        FortranObjectCache.misses = 0
+    del dropped
+
+
+def cache_info():
+    """
+    Return a dictionary with the capacity shared by the derived type object
+    caches, the number of objects they keep alive, and the number of hits
+    and misses since the last :func:`clear_caches`
+    """
+    return dict(capacity=FortranObjectCache.capacity,
+                size=len(FortranObjectCache._recent),
+                hits=FortranObjectCache.hits,
+                misses=FortranObjectCache.misses)
+
+
+def set_cache_capacity(capacity):
+    """
+    Set the total number of recently used objects the instances of
+    :class:`FortranObjectCache` keep alive between them
+    """
+    if capacity < 0:
+        raise ValueError('cache capacity must be non-negative')
+    with FortranObjectCache._lock:
+        FortranObjectCache.capacity = capacity
+        dropped = _trim_recent(capacity)
+    del dropped
+
+
 class FortranModule(object):
     """
     Baseclass for Fortran modules
@@ -24,47 +180,217 @@ class FortranModule(object):
 
     def __init__(self):
         self._arrays = {}
-        self._objs = {}
+        self._objs = FortranObjectCache()
 
         # initialise any derived type arrays
         for init_array in self._dt_array_initialisers:
             init_array(self)
 
 
+class _FortranMemory(object):
+    """
+    Expose Fortran memory at `address` to numpy through the array interface,
+    keeping `owner`, the Python object the memory belongs to, alive for as
+    long as any array viewing it
+    """
+
+    def __init__(self, address, dtype, shape, owner):
+        self.__array_interface__ = {'data': (address, False),
+                                    'typestr': dtype.str,
+                                    'descr': dtype.descr,
+                                    'shape': shape,
+                                    'version': 3}
+        self.owner = owner
+
+
+class _FortranOwner(object):
+    """
+    Token standing for the Fortran memory of a derived type instance,
+    used as the base object of numpy arrays viewing that memory.
+
+    The instance's Fortran finaliser is deferred to this token with
+    :meth:`defer`, so the memory is only freed once the instance and all
+    arrays viewing its memory have gone away. Tokens of instances which
+    are part of another instance keep the token of the `parent` alive.
+    Tokens never refer back to the instance, so caching views of its
+    arrays in the instance does not create reference cycles.
+    """
+
+    __slots__ = ('parent', 'finaliser', 'kwargs')
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.finaliser = None
+        self.kwargs = None
+
+    def defer(self, finaliser, **kwargs):
+        """
+        Call `finaliser` with keyword arguments `kwargs` once this token
+        is no longer referenced
+        """
+        self.finaliser = finaliser
+        self.kwargs = kwargs
+
+    def __del__(self):
+        if self.finaliser is not None:
+            self.finaliser(**self.kwargs)
+
+
+def _view_memory(address, dtype, shape, owner):
+    return np.asarray(_FortranMemory(address, dtype, shape, owner)).view(dtype)
+
+
 class FortranDerivedType(object):
     """
     Base class for Fortran derived types
+
+    Derived types whose elements are all fixed size intrinsic scalars and
+    arrays have a `_record_layout` giving the Fortran routines which
+    return their memory layout and the address of an instance, and a list
+    of ``(name, dtype, shape)`` tuples describing the elements. Their
+    instances can be viewed as numpy structured scalars with
+    :meth:`as_record`.
+
+    Arrays viewing the memory of an instance have its `_owner` token as
+    their base object, so the memory outlives the instance for as long as
+    any of these arrays do.
     """
 
     _dt_array_initialisers = []
+    _record_layout = None
 
     def __init__(self):
         self._handle = None
         self._arrays = {}
-        self._objs = {}
+        self._objs = FortranObjectCache()
         self._alloc = True
+        self._owner = _FortranOwner()
 
         # initialise any derived type arrays
         for init_array in self._dt_array_initialisers:
             init_array(self)
 
     @classmethod
-    def from_handle(cls, handle):
+    def from_handle(cls, handle, parent=None):
+        """
+        Wrap an existing Fortran derived type instance referenced by
+        `handle`, without taking ownership of it. If it is part of the
+        derived type instance `parent`, the memory of `parent` is kept
+        alive for as long as any array viewing the memory of the new
+        instance.
+        """
         self = cls.__new__(cls)
         FortranDerivedType.__init__(self)  # always call the base constructor only
         self._handle = handle
         self._alloc = False
+        if parent is not None:
+            self._owner.parent = parent._owner
         return self
 
+    @classmethod
+    def record_dtype(cls):
+        """
+        Return the numpy structured dtype matching the memory layout of
+        this derived type. Array elements have their Fortran shape
+        reversed, since numpy stores sub-arrays in C order.
+        """
+        if cls._record_layout is None:
+            raise TypeError('%s is not made only of fixed size intrinsic elements' % cls.__name__)
+        dtype = cls.__dict__.get('_record_dtype')
+        if dtype is None:
+            layoutfunc, addressfunc, elements = cls._record_layout
+            offsets, itemsize = layoutfunc()
+            dtype = np.dtype({'names': [name for (name, char, shape) in elements],
+                              'formats': [(char, tuple(reversed(shape))) if shape else char
+                                          for (name, char, shape) in elements],
+                              'offsets': [int(offset) for offset in offsets],
+                              'itemsize': int(itemsize)})
+            cls._record_dtype = dtype
+        return dtype
+
+    def as_record(self):
+        """
+        Return a zero-dimensional numpy structured array viewing the memory
+        of this derived type instance without copying it
+        """
+        dtype = self.record_dtype()
+        return _view_memory(self._record_layout[1](self._handle), dtype, (), self._owner)
+
 
 class FortranDerivedTypeArray(object):
-    def __init__(self, parent, getfunc, setfunc, lenfunc, doc, arraytype):
+    """
+    Sequence of the items in an array of derived types
+
+    `fields` maps the names of scalar elements of the derived type to
+    pairs of Fortran routines copying that element of every item in the
+    array to and from a numpy array, used by :meth:`gather` and
+    :meth:`scatter`.
+    """
+
+    def __init__(self, parent, getfunc, setfunc, lenfunc, doc, arraytype, fields=None,
+                 addressfunc=None):
         self.parent = weakref.ref(parent)
         self.getfunc = getfunc
         self.setfunc = setfunc
         self.lenfunc = lenfunc
         self.doc = doc
         self.arraytype = arraytype
+        if fields is None:
+            fields = {}
+        self.fields = fields
+        self.addressfunc = addressfunc
+
+    def _field_funcs(self, name):
+        try:
+            return self.fields[name]
+        except KeyError:
+            raise ValueError("No bulk access routines for element '%s' of %s" %
+                             (name, self.arraytype.__name__))
+
+    def gather(self, name):
+        """
+        Return a numpy array with the value of element `name` of every item
+        in the array, copied in a single Fortran call
+        """
+        parent = self.parent()
+        if parent is None:
+            raise RuntimeError("Array's parent has gone out of scope")
+        gatherfunc, scatterfunc = self._field_funcs(name)
+        return gatherfunc(parent._handle, self.lenfunc(parent._handle))
+
+    def scatter(self, name, values):
+        """
+        Set element `name` of every item in the array from the sequence
+        `values`, which must have the same length as the array, in a single
+        Fortran call
+        """
+        parent = self.parent()
+        if parent is None:
+            raise RuntimeError("Array's parent has gone out of scope")
+        gatherfunc, scatterfunc = self._field_funcs(name)
+        # the length is always passed: f2py-f90wrap would pass an omitted
+        # one to Fortran as a null pointer, and the Fortran routine checks
+        # it against the length of the array
+        values = np.asarray(values)
+        scatterfunc(parent._handle, values, len(values))
+
+    def as_structured_array(self):
+        """
+        Return a numpy structured array viewing the items of this array in
+        Fortran memory without copying them. The array is only valid until
+        the Fortran array is reallocated.
+        """
+        parent = self.parent()
+        if parent is None:
+            raise RuntimeError("Array's parent has gone out of scope")
+        if self.addressfunc is None:
+            raise TypeError('%s is not made only of fixed size intrinsic elements' %
+                            self.arraytype.__name__)
+        dtype = self.arraytype.record_dtype()
+        n = self.lenfunc(parent._handle)
+        if n == 0:
+            return np.zeros(0, dtype=dtype)
+        return _view_memory(self.addressfunc(parent._handle), dtype, (n,), parent._owner)
 
     def iterindices(self):
         return iter(range(len(self)))
@@ -93,10 +419,11 @@ class FortranDerivedTypeArray(object):
         # YANN: as "i" is passed by reference, and would be incremented on each call ! This seems wrong to me
         #       so I propose to add the +1 on the function call instead, as following.
         element_handle = self.getfunc(parent._handle, i + 1)
-        try:
-            obj = parent._objs[tuple(element_handle)]
-        except KeyError:
-            obj = parent._objs[tuple(element_handle)] = self.arraytype.from_handle(element_handle)
+        # handles are small integer arrays: their raw bytes make a compact key
+        key = element_handle.tobytes()
+        obj = parent._objs.get(key)
+        if obj is None:
+            obj = parent._objs[key] = self.arraytype.from_handle(element_handle, parent)
         return obj
 
     def __setitem__(self, i, value):
@@ -0,0 +1,199 @@
+# HF XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# HF X
+# HF X   f90wrap: F90 to Python interface generator with derived type support
+# HF X
+# HF X   Copyright James Kermode 2011
+# HF X
+# HF X   These portions of the source code are released under the GNU General
+# HF X   Public License, version 2, http://www.gnu.org/copyleft/gpl.html
+# HF X
+# HF X   If you would like to license the source code under different terms,
+# HF X   please contact James Kermode, james.kermode@gmail.com
+# HF X
+# HF X   When using this software, please cite the following reference:
+# HF X
+# HF X   http://www.jrkermode.co.uk/f90wrap
+# HF X
+# HF XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+"""
+Support for incremental regeneration of wrappers.
+
+Each module is given a signature which changes whenever the source file
+defining it, or the source of any module it depends on, changes. A module
+depends on the modules it uses, the modules defining the derived types it
+refers to, the modules whose procedures are wrapped as methods of its types
+and, with ``--joint-modules``, the modules it shares methods with. The last
+two are only known once the tree has been transformed, so signatures are
+computed from the tree returned by `transform.transform_to_generic_wrapper()`.
+
+The wrapper generators record the signature of the inputs of each file
+they write in a manifest kept in the output directory, and on the next run
+skip any output file whose inputs have the same signature as before.
+"""
+
+import ast
+import hashlib
+import logging
+import os
+import pprint
+
+from f90wrap import __version__
+from f90wrap import codegen as cg
+from f90wrap import fortran as ft
+from f90wrap.six import string_types
+
+MANIFEST_NAME = '.f90wrap_manifest'
+
+#: key used in signature dictionaries for procedures outside any module
+TOPLEVEL = None
+
+_file_signatures = {}
+
+
+def _sha1(*parts):
+    key = hashlib.sha1()
+    for part in parts:
+        key.update(part.encode('utf-8'))
+        key.update(b'\0')
+    return key.hexdigest()
+
+
+def file_signature(filename):
+    """
+    Return a hash of the contents of source file `filename`.
+    """
+    if filename not in _file_signatures:
+        with open(filename, 'rb') as f:
+            _file_signatures[filename] = hashlib.sha1(f.read()).hexdigest()
+    return _file_signatures[filename]
+
+
+def _referenced_type_modules(node, types):
+    """
+    Names of the modules defining the derived types referred to by
+    declarations anywhere below `node`.
+    """
+    mod_names = set()
+    for child in ft.walk(node):
+        if not isinstance(child, ft.Declaration):
+            continue
+        typename = getattr(child, 'type', '')
+        if typename.startswith('type') or typename.startswith('class'):
+            typ = types.get(ft.strip_type(typename))
+            if typ is not None:
+                mod_names.add(typ.mod_name)
+    return mod_names
+
+
+def module_dependencies(tree, types, joint_modules=None):
+    """
+    Return a dictionary mapping each module name in `tree` to the set of
+    names of the other modules in `tree` it directly depends on.
+    """
+    modules = dict((mod.name, mod) for mod in ft.walk_modules(tree))
+    deps = {}
+    for mod in modules.values():
+        mod_deps = set()
+        uses = list(mod.uses)
+        for proc in ft.walk(mod):
+            if isinstance(proc, ft.Procedure):
+                uses.extend(proc.uses)
+            if isinstance(proc, (ft.Procedure, ft.Interface)) and proc.mod_name is not None:
+                # procedures from other modules wrapped as methods of this
+                # module's types by transform.MethodFinder
+                mod_deps.add(proc.mod_name)
+        for use in uses:
+            if not isinstance(use, string_types):
+                use = use[0]
+            mod_deps.add(use)
+        mod_deps |= _referenced_type_modules(mod, types)
+        deps[mod.name] = mod_deps
+
+    if joint_modules is not None:
+        for mod_name, others in joint_modules.items():
+            if isinstance(others, string_types):
+                others = [others]
+            for other in others:
+                deps.setdefault(mod_name, set()).add(other)
+                deps.setdefault(other, set()).add(mod_name)
+
+    for mod_name in deps:
+        deps[mod_name] = set(dep for dep in deps[mod_name]
+                             if dep in modules and dep != mod_name)
+    return deps
+
+
+def module_signatures(tree, types, options='', joint_modules=None):
+    """
+    Compute a signature for each module in `tree`.
+
+    The signature of a module combines the f90wrap version, the string
+    `options` (a representation of any settings which affect the generated
+    code) and the contents of the source files defining the module and all
+    the modules it depends on, directly or indirectly.
+
+    Returns a dictionary mapping module names to signatures. Procedures
+    outside any module are given the signature stored under `TOPLEVEL`.
+    """
+    modules = dict((mod.name, mod) for mod in ft.walk_modules(tree))
+    deps = module_dependencies(tree, types, joint_modules)
+
+    def closure(mod_name):
+        seen = set([mod_name])
+        todo = [mod_name]
+        while todo:
+            for dep in deps.get(todo.pop(), ()):
+                if dep not in seen:
+                    seen.add(dep)
+                    todo.append(dep)
+        return seen
+
+    signatures = {}
+    for mod_name in modules:
+        parts = [__version__, options]
+        for dep in sorted(closure(mod_name)):
+            parts.extend([dep, file_signature(modules[dep].filename)])
+        signatures[mod_name] = _sha1(*parts)
+
+    parts = [__version__, options]
+    toplevel_deps = set()
+    for node in tree.programs + tree.procedures:
+        parts.extend([node.name, file_signature(node.filename)])
+        for mod_name in _referenced_type_modules(node, types):
+            toplevel_deps |= closure(mod_name)
+    for dep in sorted(toplevel_deps):
+        parts.extend([dep, file_signature(modules[dep].filename)])
+    signatures[TOPLEVEL] = _sha1(*parts)
+
+    return signatures
+
+
+def combine_signatures(signatures):
+    """
+    Combine a sequence of signatures into one, e.g. for an output file
+    written from several modules.
+    """
+    return _sha1(*signatures)
+
+
+def read_manifest(dest):
+    """
+    Read the manifest in directory `dest`, mapping output file names to
+    the signatures of their inputs when they were last written.
+    """
+    path = os.path.join(dest, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return ast.literal_eval(f.read())
+    except (SyntaxError, ValueError) as e:
+        logging.warning('ignoring unreadable manifest %s: %s' % (path, e))
+        return {}
+
+
+def write_manifest(dest, manifest):
+    """
+    Save `manifest` to directory `dest`.
+    """
+    cg.write_if_changed(os.path.join(dest, MANIFEST_NAME), pprint.pformat(manifest) + '\n')
@@ -0,0 +1,278 @@
+# HF XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# HF X
+# HF X   f90wrap: F90 to Python interface generator with derived type support
+# HF X
+# HF X   Copyright James Kermode 2011
+# HF X
+# HF X   These portions of the source code are released under the GNU General
+# HF X   Public License, version 2, http://www.gnu.org/copyleft/gpl.html
+# HF X
+# HF X   If you would like to license the source code under different terms,
+# HF X   please contact James Kermode, james.kermode@gmail.com
+# HF X
+# HF X   When using this software, please cite the following reference:
+# HF X
+# HF X   http://www.jrkermode.co.uk/f90wrap
+# HF X
+# HF XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+
+"""
+f90wrap.parallel
+
+Call a routine of an f90wrap generated module for many sets of arguments
+concurrently, in a pool of threads or of worker processes. Available at
+runtime as `f90wrap.runtime.parallel`.
+
+Each item of the iterable given to `map_threads()` or `map_processes()`
+holds the arguments of one call: tuples are unpacked into positional
+arguments, and any other item is passed as the only argument.
+"""
+
+import importlib
+import multiprocessing
+import multiprocessing.pool
+
+import numpy as np
+
+from f90wrap.fortrantype import FortranDerivedType
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    shared_memory = None  # Python < 3.8: all arguments are pickled
+
+# NumPy arrays of at least this many bytes are handed to worker processes
+# in shared memory rather than pickled
+share_threshold = 1 << 20
+
+# pools of worker processes, keyed on the name of the module they import
+# and the number of workers, reused by later calls to map_processes()
+_process_pools = {}
+
+
+def _call(routine, args):
+    if isinstance(args, tuple):
+        return routine(*args)
+    return routine(args)
+
+
+def map_threads(routine, iterable, workers=None):
+    """
+    Call `routine` for each item of `iterable` in a pool of `workers`
+    threads, by default one per CPU, and return the list of results.
+
+    Arguments, including derived type instances and arrays, are passed to
+    the routine unchanged. Calls only run concurrently if the extension
+    module was built with ``f2py-f90wrap --release-gil``; otherwise each
+    call holds the global interpreter lock until it returns.
+    """
+    pool = multiprocessing.pool.ThreadPool(workers)
+    try:
+        return pool.map(lambda args: _call(routine, args), iterable)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class _SharedArray(object):
+    """
+    Picklable reference to a NumPy array copied to a shared memory block
+    """
+
+    __slots__ = ('name', 'shape', 'dtype', 'order')
+
+    def __init__(self, name, shape, dtype, order):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.order = order
+
+    def __getstate__(self):
+        return (self.name, self.shape, self.dtype, self.order)
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype, self.order = state
+
+
+class _TypeRecord(object):
+    """
+    Picklable copy of a derived type instance: its class and a copy of its
+    memory as a numpy structured scalar
+    """
+
+    __slots__ = ('cls', 'record')
+
+    def __init__(self, cls, record):
+        self.cls = cls
+        self.record = record
+
+    def __getstate__(self):
+        return (self.cls, self.record)
+
+    def __setstate__(self, state):
+        self.cls, self.record = state
+
+    @classmethod
+    def from_instance(cls, obj):
+        if obj._record_layout is None:
+            raise TypeError('%s instances cannot be passed between processes, as they are not '
+                            'made only of fixed size intrinsic elements' % type(obj).__name__)
+        return cls(type(obj), obj.as_record().copy())
+
+    def to_instance(self):
+        obj = self.cls()
+        obj.as_record()[()] = self.record
+        return obj
+
+
+def _share(array, blocks):
+    """
+    Copy `array` to a new shared memory block, appended to `blocks`
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks.append(block)
+    order = np.isfortran(array) and 'F' or 'C'
+    np.ndarray(array.shape, array.dtype, buffer=block.buf, order=order)[...] = array
+    return _SharedArray(block.name, array.shape, array.dtype, order)
+
+
+def _pack_args(args, blocks):
+    """
+    Replace derived type instances and large arrays among the arguments
+    `args` of one call by picklable references to copies of them
+    """
+    def pack(value):
+        if isinstance(value, FortranDerivedType):
+            return _TypeRecord.from_instance(value)
+        if (isinstance(value, np.ndarray) and shared_memory is not None and
+                value.nbytes >= share_threshold):
+            return _share(value, blocks)
+        return value
+
+    if isinstance(args, tuple):
+        return tuple([pack(value) for value in args])
+    return pack(args)
+
+
+def _worker_call(task):
+    """
+    Call a routine in a worker process, with arguments as packed by
+    `_pack_args()`, and return its results in a picklable form
+    """
+    routine, args = task
+    blocks = []
+    shared = []
+
+    def unpack(value):
+        if isinstance(value, _TypeRecord):
+            return value.to_instance()
+        if isinstance(value, _SharedArray):
+            block = shared_memory.SharedMemory(name=value.name)
+            blocks.append(block)
+            array = np.ndarray(value.shape, value.dtype, buffer=block.buf, order=value.order)
+            shared.append(array)
+            return array
+        return value
+
+    def pack(value):
+        if isinstance(value, FortranDerivedType):
+            return _TypeRecord.from_instance(value)
+        if isinstance(value, np.ndarray) and any(np.may_share_memory(value, array)
+                                                 for array in shared):
+            return value.copy()  # shared memory is released below
+        return value
+
+    try:
+        if isinstance(args, tuple):
+            result = _call(routine, tuple([unpack(value) for value in args]))
+        else:
+            result = _call(routine, unpack(args))
+        if isinstance(result, tuple):
+            packed = tuple([pack(value) for value in result])
+        else:
+            packed = pack(result)
+        result = None
+    finally:
+        del shared[:]
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass  # still viewed from a traceback; closed when collected
+    return packed
+
+
+def _unpack_result(result):
+    def unpack(value):
+        if isinstance(value, _TypeRecord):
+            return value.to_instance()
+        return value
+
+    if isinstance(result, tuple):
+        return tuple([unpack(value) for value in result])
+    return unpack(result)
+
+
+def _process_pool(module_name, workers):
+    """
+    Return a pool of `workers` processes, each of which has imported
+    module `module_name` once, reusing a pool made by an earlier call
+    """
+    key = (module_name, workers)
+    pool = _process_pools.get(key)
+    if pool is None:
+        if shared_memory is not None:
+            # start the tracker of shared memory blocks before the workers,
+            # so they share it rather than each starting their own
+            resource_tracker.ensure_running()
+        pool = multiprocessing.Pool(workers, importlib.import_module, (module_name,))
+        _process_pools[key] = pool
+    return pool
+
+
+def map_processes(routine, iterable, workers=None):
+    """
+    Call `routine` for each item of `iterable` in a pool of `workers`
+    processes, by default one per CPU, and return the list of results.
+
+    `routine` should be a function of an f90wrap generated Python module,
+    or a method of one of its derived type instances. The worker processes
+    import this module, and so its extension module, once when they start,
+    and are reused by later calls with routines from the same module,
+    until `shutdown()` is called.
+
+    Arguments and results are copied between processes, so changes the
+    routine makes to its arguments are not seen by the caller. Derived
+    type instances are copied as records (see
+    `FortranDerivedType.as_record()`), so only types made of fixed size
+    intrinsic elements can be passed or returned. NumPy arrays of at least
+    `share_threshold` bytes are copied once into shared memory, which the
+    workers use without copying, rather than being pickled.
+    """
+    self = getattr(routine, '__self__', None)
+    if isinstance(self, FortranDerivedType):
+        # pass the instance as the first argument of the plain function
+        routine = routine.__func__
+        iterable = [(self,) + (isinstance(args, tuple) and args or (args,))
+                    for args in iterable]
+
+    pool = _process_pool(routine.__module__, workers)
+    blocks = []
+    try:
+        tasks = [(routine, _pack_args(args, blocks)) for args in iterable]
+        results = pool.map(_worker_call, tasks)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return [_unpack_result(result) for result in results]
+
+
+def shutdown():
+    """
+    Stop the worker processes started by `map_processes()`
+    """
+    for pool in _process_pools.values():
+        pool.close()
+        pool.join()
+    _process_pools.clear()
@@ -35,8 +35,14 @@
 # Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 # MA 02111-1307 USA
 
+import hashlib
+import os
+import pickle
 import string
+import tempfile
+from collections import deque
 
+from f90wrap import __version__
 from f90wrap.fortran import *
 
 # Define some regular expressions
@@ -68,7 +74,7 @@ c_ret = re.compile(r'\r')
 iface = re.compile('^interface', re.IGNORECASE)
 iface_end = re.compile('^end\s*interface|end$', re.IGNORECASE)
 
-subt = re.compile(r'^(recursive\s+)?subroutine', re.IGNORECASE)
+subt = re.compile(r'^((recursive|pure|elemental)\s+)*subroutine', re.IGNORECASE)
 subt_end = re.compile(r'^end\s*subroutine\s*(\w*)|end$', re.IGNORECASE)
 
 funct = re.compile('^((' + types + r')\s+)*function', re.IGNORECASE)
@@ -195,29 +201,40 @@ def split_attribs(atr):
     return list(map(lambda s: s.strip(), atrl))  # jrk33 added strip
 
 
-hold_doc = None
-
 
 class F90File(object):
+    """
+    Logical-line reader for a Fortran source file.
+
+    Physical lines are held in a `collections.deque` and consumed from the
+    left, so that joining continuation lines and splitting off trailing
+    comments only ever touches the first couple of entries. Reading a whole
+    file is therefore linear in its number of lines.
+    """
+
     def __init__(self, fname):
         self.filename = fname
         self.file = open(fname, 'r')
-        self.lines = self.file.readlines()
+        self.lines = deque(self.file.readlines())
         self._lineno = 0
         self._lineno_offset = 0
         self.file.close()
         self.dquotes = []
         self.squotes = []
+        # doc comments waiting to be attached to the next module,
+        # interface or procedure found in this file
+        self.hold_doc = None
 
     @property
     def lineno(self):
         return self._lineno + self._lineno_offset
 
     def next(self):
+        lines = self.lines
         cline = ''
 
-        while (cline == '' and len(self.lines) != 0):
-            cline = self.lines[0].strip()
+        while (cline == '' and len(lines) != 0):
+            cline = lines[0].strip()
             if cline.find('_FD') == 1:
                 break
 
@@ -231,7 +248,7 @@ class F90File(object):
             else:
                 cont_index = cline.find('&')
                 try:
-                    cont2 = self.lines[1].strip()
+                    cont2 = lines[1].strip()
                     if cont2.startswith('&'):
                         cont2_index = 0
                     else:
@@ -245,16 +262,17 @@ class F90File(object):
                         cont = cline[:cont_index].strip()
                     else:
                         cont = cline.strip()
-                    cont2 = self.lines[1].strip()
+                    cont2 = lines[1].strip()
                     if cont2.startswith('&'):
                         cont2 = cont2[1:].strip()
                     cont = cont + cont2
-                    self.lines = [cont] + self.lines[2:]
+                    lines.popleft()
+                    lines[0] = cont
                     self._lineno = self._lineno + 1
-                    cline = self.lines[0].strip()
+                    cline = lines[0].strip()
                     cont_index = cline.find('&')
                     try:
-                        cont2 = self.lines[1].strip()
+                        cont2 = lines[1].strip()
                         if cont2.startswith('&'):
                             cont2_index = 0
                         else:
@@ -265,21 +283,20 @@ class F90File(object):
             # split by '!', if necessary
             comm_index = cline.find('!')
             if comm_index != -1:
-                self.lines = [cline[:comm_index], cline[comm_index:]] + self.lines[1:]
-                cline = self.lines[0]
-                cline = cline.strip()
+                # the comment is pushed back as its own line, to be
+                # returned by the following call to next()
+                comm = cline[comm_index:]
+                cline = cline[:comm_index].strip()
                 # jrk33 - changed comment mark from '!*FD' to '!%'
-                if self.lines[1].find('!%') != -1:
-                    self.lines = [self.lines[0]] + ['_FD' + self.lines[1][2:]] + self.lines[2:]
-                    self._lineno_offset = 1
+                if comm.find('!%') != -1:
+                    lines[0] = '_FD' + comm[2:]
                 else:
-                    self.lines = [self.lines[0]] + ['_COMMENT' + self.lines[1][1:]] + self.lines[2:]
-                    self._lineno_offset = 1
+                    lines[0] = '_COMMENT' + comm[1:]
+                self._lineno_offset = 1
             else:
                 self._lineno_offset = 0
                 self._lineno = self._lineno + 1
-
-            self.lines = self.lines[1:]
+                lines.popleft()
 
         if cline == '':
             return None
@@ -356,7 +373,6 @@ def check_cont(cline, file):
 # +++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 def check_program(cl, file):
-    global hold_doc
 
     out = Program()
     cont = 0
@@ -403,10 +419,10 @@ def check_program(cl, file):
                 # jrk33 - hold doc comment relating to next subrt or funct
                 check = check_doc(cl, file)
                 if check[0] != None:
-                    if hold_doc == None:
-                        hold_doc = [check[0]]
+                    if file.hold_doc == None:
+                        file.hold_doc = [check[0]]
                     else:
-                        hold_doc.append(check[0])
+                        file.hold_doc.append(check[0])
                     cl = check[1]
                     continue
 
@@ -440,7 +456,6 @@ def check_program(cl, file):
 # +++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 def check_module(cl, file):
-    global hold_doc
 
     out = Module()
     cont = 0
@@ -452,10 +467,10 @@ def check_module(cl, file):
 
         # jrk33 - if we're holding a doc comment from before
         # subroutine definition, spit it out now
-        if hold_doc is not None:
-            for line in hold_doc:
+        if file.hold_doc is not None:
+            for line in file.hold_doc:
                 out.doc.append(line)
-            hold_doc = None
+            file.hold_doc = None
 
         # Get module name
         cl = module.sub('', cl)
@@ -486,10 +501,10 @@ def check_module(cl, file):
                 # Doc comment
                 check = check_doc(cl, file)
                 if check[0] != None:
-                    if hold_doc == None:
-                        hold_doc = [check[0]]
+                    if file.hold_doc == None:
+                        file.hold_doc = [check[0]]
                     else:
-                        hold_doc.append(check[0])
+                        file.hold_doc.append(check[0])
                     cl = check[1]
                     continue
 
@@ -547,10 +562,10 @@ def check_module(cl, file):
                 # jrk33 - hold doc comment relating to next subrt or funct
                 check = check_doc(cl, file)
                 if check[0] != None:
-                    if hold_doc == None:
-                        hold_doc = [check[0]]
+                    if file.hold_doc == None:
+                        file.hold_doc = [check[0]]
                     else:
-                        hold_doc.append(check[0])
+                        file.hold_doc.append(check[0])
                     cl = check[1]
                     continue
 
@@ -608,7 +623,6 @@ def check_module(cl, file):
 # +++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 def check_subt(cl, file, grab_hold_doc=True):
-    global hold_doc
 
     out = Subroutine()
         
@@ -757,10 +771,10 @@ def check_subt(cl, file, grab_hold_doc=True):
 
         # jrk33 - if we're holding a doc comment from before
         # subroutine definition, spit it out now
-        if grab_hold_doc and hold_doc is not None:
-            for line in hold_doc:
+        if grab_hold_doc and file.hold_doc is not None:
+            for line in file.hold_doc:
                 out.doc.append(line)
-            hold_doc = None
+            file.hold_doc = None
 
         out.lineno = slice(out.lineno, file.lineno - 1)
         return [out, cl]
@@ -788,7 +802,6 @@ def implicit_type_rule(var):
 # +++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 def check_funct(cl, file, grab_hold_doc=True):
-    global hold_doc
 
     out = Function()
 
@@ -968,10 +981,10 @@ def check_funct(cl, file, grab_hold_doc=True):
 
         # jrk33 - if we're holding a doc comment from before
         # subroutine definition, spit it out now
-        if grab_hold_doc and hold_doc is not None:
-            for line in hold_doc:
+        if grab_hold_doc and file.hold_doc is not None:
+            for line in file.hold_doc:
                 out.doc.append(line)
-            hold_doc = None
+            file.hold_doc = None
 
         out.lineno = slice(out.lineno, file.lineno - 1)
         return [out, cl]
@@ -982,8 +995,6 @@ def check_funct(cl, file, grab_hold_doc=True):
 # +++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 def check_type(cl, file):
-    #    global hold_doc
-
     out = Type()
     m = re.match(type_re, cl)
     current_access = None
@@ -998,10 +1009,10 @@ def check_type(cl, file):
         if decl.match(cl) != None:
             return [None, cl]
 
-        # if hold_doc != None:
-        #            for line in hold_doc:
+        # if file.hold_doc != None:
+        #            for line in file.hold_doc:
         #                out.doc.append(line)
-        #            hold_doc = None
+        #            file.hold_doc = None
 
         # Get type name
         cl = type_re.sub('', cl)
@@ -1053,7 +1064,6 @@ def check_type(cl, file):
 # +++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 def check_interface(cl, file):
-    global hold_doc
 
     out = Interface()
 
@@ -1068,10 +1078,10 @@ def check_interface(cl, file):
         # if out.name == '':
         #    return [None, cl]
 
-        if hold_doc is not None:
-            for line in hold_doc:
+        if file.hold_doc is not None:
+            for line in file.hold_doc:
                 out.doc.append(line)
-            hold_doc = None
+            file.hold_doc = None
 
         cl = file.next()
         while re.match(iface_end, cl) == None:
@@ -1314,69 +1324,168 @@ def check_arg(cl, file):
 # +++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 
-def read_files(args):
-    global hold_doc
+def read_file(fname):
+    """
+    Parse a single Fortran source file, returning a `fortran.Root`
+    containing the programs, modules and top-level procedures it defines.
+    """
+
+    # Open the filename for reading
+
+    logging.debug('processing file ' + fname)
+    file = F90File(fname)
 
     root = Root()
 
-    for fn in args:
+    # Get first line
 
-        fname = fn
+    cline = file.next()
 
-        # Open the filename for reading
+    while cline != None:
 
-        logging.debug('processing file ' + fname)
-        file = F90File(fname)
+        # programs
+        check = check_program(cline, file)
+        if check[0] != None:
+            logging.debug('  program ' + check[0].name)
+            root.programs.append(check[0])
+            cline = check[1]
+            continue
 
-        # Get first line
+        # modules
+        check = check_module(cline, file)
+        if check[0] != None:
+            logging.debug('  module ' + check[0].name)
+            root.modules.append(check[0])
+            cline = check[1]
+            continue
 
-        cline = file.next()
+        # jrk33 - hold doc comment relating to next module, subrt or funct
+        check = check_doc(cline, file)
+        if check[0] != None:
+            if file.hold_doc == None:
+                file.hold_doc = [check[0]]
+            else:
+                file.hold_doc.append(check[0])
+            cline = check[1]
+            continue
 
-        while cline != None:
+        # stand-alone subroutines
+        check = check_subt(cline, file)
+        if check[0] != None:
+            # logging.debug('  subroutine ' + check[0].name)
+            root.procedures.append(check[0])
+            cline = check[1]
+            continue
 
-            # programs
-            check = check_program(cline, file)
-            if check[0] != None:
-                logging.debug('  program ' + check[0].name)
-                root.programs.append(check[0])
-                cline = check[1]
-                continue
+        # stand-alone functions
+        check = check_funct(cline, file)
+        if check[0] != None:
+            # logging.debug('  function ' + check[0].name)
+            root.procedures.append(check[0])
+            cline = check[1]
+            continue
 
-            # modules
-            check = check_module(cline, file)
-            if check[0] != None:
-                logging.debug('  module ' + check[0].name)
-                root.modules.append(check[0])
-                cline = check[1]
-                continue
+        cline = file.next()
 
-            # jrk33 - hold doc comment relating to next module, subrt or funct
-            check = check_doc(cline, file)
-            if check[0] != None:
-                if hold_doc == None:
-                    hold_doc = [check[0]]
-                else:
-                    hold_doc.append(check[0])
-                cline = check[1]
-                continue
+    return root
 
-            # stand-alone subroutines
-            check = check_subt(cline, file)
-            if check[0] != None:
-                # logging.debug('  subroutine ' + check[0].name)
-                root.procedures.append(check[0])
-                cline = check[1]
-                continue
 
-            # stand-alone functions
-            check = check_funct(cline, file)
-            if check[0] != None:
-                # logging.debug('  function ' + check[0].name)
-                root.procedures.append(check[0])
-                cline = check[1]
-                continue
+def parse_cache_path(cache_dir, fname):
+    """
+    Return the path of the parse cache entry for source file `fname`.
+
+    Entries are keyed by a hash of the f90wrap version, the file name as
+    given (which is recorded in the parse tree) and the file contents.
+    """
+    key = hashlib.sha1()
+    key.update(__version__.encode('utf-8'))
+    key.update(b'\0' + fname.encode('utf-8') + b'\0')
+    with open(fname, 'rb') as f:
+        key.update(f.read())
+    return os.path.join(cache_dir, key.hexdigest() + '.pickle')
+
+
+def load_cached_file(cache_path):
+    """
+    Load a `fortran.Root` from the parse cache, or return None if there is
+    no usable entry at `cache_path`.
+    """
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        logging.warning('ignoring unreadable parse cache entry %s: %s' % (cache_path, e))
+        return None
+
+
+def store_cached_file(cache_path, file_root):
+    """
+    Save `file_root` as the parse cache entry `cache_path`.
+
+    The entry is written to a temporary file and renamed into place,
+    replacing any entry stored by a concurrent run sharing the cache
+    directory, so those runs never see partial entries.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(file_root, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def read_files(args, jobs=1, cache_dir=None):
+    """
+    Parse the Fortran source files in `args` into a single `fortran.Root`.
+
+    If `jobs` is greater than one, the files are parsed in a pool of `jobs`
+    worker processes. The per-file trees are merged in the order the files
+    are given, so the result is the same as for a serial parse.
+
+    If `cache_dir` is given, the tree for each file is looked up in and
+    saved to that directory (see `parse_cache_path()`), so that only files
+    which have changed since a previous run need to be parsed again.
+    """
+
+    file_roots = [None] * len(args)
+    cache_paths = [None] * len(args)
+    if cache_dir is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        for i, fname in enumerate(args):
+            cache_paths[i] = parse_cache_path(cache_dir, fname)
+            file_roots[i] = load_cached_file(cache_paths[i])
+            if file_roots[i] is not None:
+                logging.debug('using cached parse tree for file ' + fname)
+
+    to_parse = [i for i in range(len(args)) if file_roots[i] is None]
+    if jobs > 1 and len(to_parse) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(jobs, len(to_parse)))
+        try:
+            parsed = pool.map(read_file, [args[i] for i in to_parse])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        parsed = [read_file(args[i]) for i in to_parse]
+
+    for i, file_root in zip(to_parse, parsed):
+        file_roots[i] = file_root
+        if cache_paths[i] is not None:
+            store_cached_file(cache_paths[i], file_root)
 
-            cline = file.next()
+    root = Root()
+    for file_root in file_roots:
+        root.programs.extend(file_root.programs)
+        root.modules.extend(file_root.modules)
+        root.procedures.extend(file_root.procedures)
 
     # apply some rules to the parsed tree
     from f90wrap.fortran import fix_argument_attributes, LowerCaseConverter
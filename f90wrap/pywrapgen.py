@@ -20,13 +20,62 @@ import os
 import logging
 import re
 
+import numpy as np
+
 from f90wrap.transform import ArrayDimensionConverter
 from f90wrap import fortran as ft
 from f90wrap import codegen as cg
+from f90wrap import incremental
 
 def normalise_class_name(name, name_map):
     return name_map.get(name.lower(), name.title())
 
+# numpy type characters, indexed by the type numbers returned by
+# fortran.fortran_array_type()
+_numpy_type_chars = dict((np.dtype(c).num, np.dtype(c).char) for c in np.typecodes['All'])
+
+def overload_signature(node, class_names, kind_map):
+    """
+    Describe the arguments of procedure `node` as a list of
+    ``(name, kind, rank, dtype, optional)`` tuples, in the format
+    expected by :class:`f90wrap.runtime.overload`.
+    """
+    signature = []
+    for arg in node.arguments:
+        dims = [attr for attr in arg.attributes if attr.startswith('dimension')]
+        rank = 0
+        if dims:
+            rank = len(ArrayDimensionConverter.split_dimensions(dims[0]))
+        dtype = None
+        if 'callback' in arg.attributes:
+            kind = 'callback'
+        elif arg.type.startswith('type') or arg.type.startswith('class'):
+            kind = 'type'
+            dtype = normalise_class_name(ft.strip_type(arg.type), class_names)
+        elif arg.type.startswith('logical'):
+            kind = 'b'
+        elif arg.type.startswith('character'):
+            kind = 'S'
+        else:
+            try:
+                dtype = _numpy_type_chars[ft.fortran_array_type(arg.type, kind_map)]
+                kind = np.dtype(dtype).kind.replace('u', 'i')
+            except (RuntimeError, KeyError):
+                kind = arg.type.startswith('complex') and 'c' or \
+                       arg.type.startswith('integer') and 'i' or 'f'
+        optional = 'optional' in arg.attributes or arg.value is None
+        signature.append((arg.py_name, kind, rank, dtype, optional))
+    return signature
+
+def is_fixed_size_array(el, dims):
+    """
+    Return True if array element `el`, with dimension attribute `dims`, can
+    never move or change shape, so that a view of it is always valid
+    """
+    if 'allocatable' in el.attributes or 'pointer' in el.attributes:
+        return False
+    return all(dim.strip() != ':' for dim in ArrayDimensionConverter.split_dimensions(dims))
+
 def format_call_signature(node):
     if isinstance(node, ft.Procedure):
         sig = ''
@@ -135,7 +184,8 @@ def format_doc_string(node):
 class PythonWrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
     def __init__(self, prefix, mod_name, types, f90_mod_name=None,
                  make_package=False, kind_map=None, init_file=None,
-                 py_mod_names=None, class_names=None, dest = '.'):
+                 py_mod_names=None, class_names=None, dest = '.', signatures=None,
+                 batch=None):
         cg.CodeGenerator.__init__(self, indent=' ' * 4,
                                max_length=80,
                                continuation='\\',
@@ -158,18 +208,64 @@ class PythonWrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
         self.dest = os.path.abspath(dest)
         if not os.path.exists(dest):
             os.mkdir(dest)
+        self.signatures = signatures
+        self.unchanged_files = set()
+        if batch is None:
+            batch = []
+        self.batch = set([name.lower() for name in batch])
     
-    def open_file(self, name, mode):
-        path = os.path.join(self.dest, name)
-        _file = open(path, mode)
-        return _file        
+    def open_file(self, name, mode='w'):
+        """
+        Open the output file `name` for writing. The file is only replaced,
+        atomically, when it is closed and only if its contents have changed.
+        """
+        if mode != 'w':
+            raise ValueError('output files can only be opened in mode "w"')
+        return cg.OutputFile(os.path.join(self.dest, name))
+
+    def wrapper_file_name(self, mod=None):
+        """
+        Name of the Python file written for module `mod`, or for the
+        top-level code if `mod` is None.
+        """
+        if not self.make_package:
+            return '%s.py' % self.py_mod_name
+        if mod is None:
+            return os.path.join(self.py_mod_name, '__init__.py')
+        return os.path.join(self.py_mod_name, self.py_mod_names.get(mod.name, mod.name) + '.py')
+
+    def find_unchanged_files(self, node):
+        """
+        Return the names of the Python files which do not need to be
+        regenerated, and the manifest updated with the signatures of all
+        Python files for this tree.
+        """
+        manifest = incremental.read_manifest(self.dest)
+        # the top-level file imports every module, so depends on all of them
+        all_signatures = [self.signatures[incremental.TOPLEVEL]]
+        all_signatures += [self.signatures[mod.name] for mod in node.modules]
+        file_signatures = {self.wrapper_file_name(): incremental.combine_signatures(all_signatures)}
+        if self.make_package:
+            for mod in node.modules:
+                file_signatures[self.wrapper_file_name(mod)] = self.signatures[mod.name]
+
+        unchanged_files = set()
+        for name, signature in file_signatures.items():
+            if (manifest.get(name) == signature and
+                    os.path.exists(os.path.join(self.dest, name))):
+                logging.info('PythonWrapperGenerator: %s is up to date' % name)
+                unchanged_files.add(name)
+        manifest.update(file_signatures)
+        return unchanged_files, manifest
 
     def write_imports(self, insert=0):
         default_imports = [(self.f90_mod_name, None),
                            ('f90wrap.runtime', None),
                            ('logging', None)]
         imp_lines = ['from __future__ import print_function, absolute_import, division']
-        for (mod, symbol) in default_imports + list(self.imports):
+        # sort so that regenerated files are identical
+        imports = sorted(self.imports, key=lambda imp: (imp[0], str(imp[1])))
+        for (mod, symbol) in default_imports + imports:
             if symbol is None:
                 imp_lines.append('import %s' % mod)
             elif isinstance(symbol, tuple):
@@ -185,6 +281,11 @@ class PythonWrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
         """
         Wrap subroutines and functions that are outside of any Fortran modules
         """
+        if self.signatures is not None:
+            self.unchanged_files, manifest = self.find_unchanged_files(node)
+            if not self.make_package and self.wrapper_file_name() in self.unchanged_files:
+                return
+
         if self.make_package:
             package_path = os.path.join(self.dest, self.py_mod_name)
             if not os.path.exists(package_path):
@@ -202,17 +303,21 @@ class PythonWrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
                                   self.py_mod_names.get(py_mod, py_mod), None))
         self.write_imports(0)
 
-        if self.make_package:
-            py_wrapper_file = self.open_file(os.path.join(self.py_mod_name, '__init__.py'), 'w')
-        else:
-            py_wrapper_file = self.open_file('%s.py' % self.py_mod_name, 'w')
-        py_wrapper_file.write(str(self))
-        if self.init_file is not None:
-            py_wrapper_file.write(open(self.init_file).read())
-        py_wrapper_file.close()
+        if self.wrapper_file_name() not in self.unchanged_files:
+            py_wrapper_file = self.open_file(self.wrapper_file_name(), 'w')
+            py_wrapper_file.write(str(self))
+            if self.init_file is not None:
+                py_wrapper_file.write(open(self.init_file).read())
+            py_wrapper_file.close()
+
+        if self.signatures is not None:
+            incremental.write_manifest(self.dest, manifest)
 
     def visit_Module(self, node):
         logging.info('PythonWrapperGenerator visiting module %s' % node.name)
+        if self.make_package and self.wrapper_file_name(node) in self.unchanged_files:
+            self.py_mods.append(node.name)
+            return
         cls_name = normalise_class_name(node.name, self.class_names)
         node.array_initialisers = []
         node.dt_array_initialisers = []
@@ -250,7 +355,8 @@ class PythonWrapperGenerator(ft.FortranVisitor, cg.CodeGenerator):
         # insert import statements at the beginning of module
         if self.make_package:
             index = self.write_imports(index)
-            self.writelines(['_arrays = {}', '_objs = {}', '\n'],
+            self.writelines(['_arrays = {}',
+                             '_objs = f90wrap.runtime.FortranObjectCache()', '\n'],
                             insert=index)
             self.write()
 
@@ -272,8 +378,7 @@ except ValueError:
     func()
             ''')
             if len(self.code) > 0:
-                py_mod_name = self.py_mod_names.get(node.name, node.name)
-                py_wrapper_file = self.open_file(os.path.join(self.py_mod_name, py_mod_name + '.py'), 'w')
+                py_wrapper_file = self.open_file(self.wrapper_file_name(node), 'w')
                 py_wrapper_file.write(str(self))
                 py_wrapper_file.close()
                 self.py_mods.append(node.name)
@@ -331,7 +436,8 @@ except ValueError:
         self.write(format_doc_string(node))
         self.write('if self._alloc:')
         self.indent()
-        self.write('%(mod_name)s.%(prefix)s%(func_name)s(%(f90_arg_names)s)' % dct)
+        # finalise once arrays viewing the Fortran memory have gone too
+        self.write('self._owner.defer(%(mod_name)s.%(prefix)s%(func_name)s, %(f90_arg_names)s)' % dct)
         self.dedent()
         self.dedent()
         self.write()
@@ -365,6 +471,12 @@ except ValueError:
             if not self.make_package and node.mod_name is not None and node.type_name is None:
                 # procedures outside of derived types become static methods
                 self.write('@staticmethod')
+            if node.name.lower() in self.batch and ft.is_batchable(node):
+                self.write('@f90wrap.runtime.batch(lambda %(py_arg_names)s: '
+                           '%(mod_name)s.%(prefix)s%(func_name)s_batch(%(f90_arg_names)s))' % dct)
+            if ft.is_broadcastable(node):
+                self.write('@f90wrap.runtime.elemental(lambda %(py_arg_names)s: '
+                           '%(mod_name)s.%(prefix)s%(func_name)s_elemental(%(f90_arg_names)s))' % dct)
             self.write("def %(method_name)s(%(py_arg_names)s):" % dct)
             self.indent()
             self.write(format_doc_string(node))
@@ -423,22 +535,40 @@ except ValueError:
         if not self.make_package:
             # procedures outside of derived types become static methods
             self.write('@staticmethod')
-        self.write('def %(intf_name)s(*args, **kwargs):' % dct)
-        self.indent()
-        self.write(format_doc_string(node))
-        # try to call each in turn until no TypeError raised
-        self.write('for proc in %(proc_names)s:' % dct)
-        self.indent()
-        self.write('try:')
-        self.indent()
-        self.write('return proc(*args, **kwargs)')
-        self.dedent()
-        self.write('except TypeError:')
-        self.indent()
-        self.write('continue')
-        self.dedent()
-        self.dedent()
-        self.dedent()
+
+        if any('constructor' in proc.attributes or 'destructor' in proc.attributes
+               for proc in node.procedures):
+            self.write('def %(intf_name)s(*args, **kwargs):' % dct)
+            self.indent()
+            self.write(format_doc_string(node))
+            # try to call each in turn until no TypeError raised
+            self.write('for proc in %(proc_names)s:' % dct)
+            self.indent()
+            self.write('try:')
+            self.indent()
+            self.write('return proc(*args, **kwargs)')
+            self.dedent()
+            self.write('except TypeError:')
+            self.indent()
+            self.write('continue')
+            self.dedent()
+            self.dedent()
+            self.dedent()
+        else:
+            # dispatch on the types of the arguments, using a table
+            # built from the signatures of the specific procedures
+            self.write('@f90wrap.runtime.overload([')
+            self.indent()
+            for proc in node.procedures:
+                self.write('%r,' % overload_signature(proc, self.class_names,
+                                                      self.kind_map))
+            self.dedent()
+            self.write('])')
+            self.write('def %(intf_name)s(*args, **kwargs):' % dct)
+            self.indent()
+            self.write(format_doc_string(node))
+            self.write('return %(proc_names)s' % dct)
+            self.dedent()
         self.write()
 
 
@@ -463,11 +593,33 @@ except ValueError:
             elif el.type.startswith('type'):  # array of derived types
                 self.write_dt_array_wrapper(node, el, dims[0])
             else:
-                self.write_sc_array_wrapper(node, el, dims, properties)
+                self.write_sc_array_wrapper(node, el, dims[0], properties)
         self.write_repr(node, properties)
 
         self.write('_dt_array_initialisers = [%s]' % (', '.join(node.dt_array_initialisers)))
         self.write()
+
+        fixed_arrays = []
+        for el in node.elements:
+            dims = [attr for attr in el.attributes if attr.startswith('dimension')]
+            if dims and not el.type.startswith('type') and is_fixed_size_array(el, dims[0]):
+                fixed_arrays.append(el.name)
+        if fixed_arrays:
+            self.write('_fixed_arrays = (%r,' % fixed_arrays)
+            self.write('                 [%s])' % ', '.join(['%s.%s%s__array__%s' % (self.f90_mod_name, self.prefix,
+                                                                                   node.name, name)
+                                                         for name in fixed_arrays]))
+            self.write()
+
+        elements = ft.record_elements(node, self.kind_map)
+        if elements is not None:
+            dct = dict(mod_name=self.f90_mod_name, prefix=self.prefix, type_name=node.name,
+                       elements=repr([(name, _numpy_type_chars[typenum], shape)
+                                      for (name, typenum, shape) in elements]))
+            self.write('''_record_layout = (%(mod_name)s.%(prefix)s%(type_name)s__record_layout,
+                  %(mod_name)s.%(prefix)s%(type_name)s__record_address,
+                  %(elements)s)''' % dct)
+            self.write()
         self.dedent()
         self.write()
 
@@ -560,7 +712,8 @@ except ValueError:
                    self='self',
                    selfdot='self.',
                    selfcomma='self, ',
-                   handle=isinstance(node, ft.Type) and 'self._handle' or '')
+                   handle=isinstance(node, ft.Type) and 'self._handle' or '',
+                   parent=isinstance(node, ft.Type) and ', self' or '')
         if isinstance(node, ft.Type):
             dct['set_args'] = '%(handle)s, %(el_name)s' % dct
         else:
@@ -594,11 +747,11 @@ except ValueError:
         if isinstance(node, ft.Module) and self.make_package:
             self.write('global %(el_name)s' % dct)
         self.write('''%(el_name)s_handle = %(mod_name)s.%(prefix)s%(type_name)s__get__%(el_name)s(%(handle)s)
-if tuple(%(el_name)s_handle) in %(selfdot)s_objs:
-    %(el_name)s = %(selfdot)s_objs[tuple(%(el_name)s_handle)]
-else:
-    %(el_name)s = %(cls_mod_name)s%(cls_name)s.from_handle(%(el_name)s_handle)
-    %(selfdot)s_objs[tuple(%(el_name)s_handle)] = %(el_name)s
+%(el_name)s_key = %(el_name)s_handle.tobytes()
+%(el_name)s = %(selfdot)s_objs.get(%(el_name)s_key)
+if %(el_name)s is None:
+    %(el_name)s = %(cls_mod_name)s%(cls_name)s.from_handle(%(el_name)s_handle%(parent)s)
+    %(selfdot)s_objs[%(el_name)s_key] = %(el_name)s
 return %(el_name)s''' % dct)
         self.dedent()
         self.write()
@@ -623,7 +776,8 @@ return %(el_name)s''' % dct)
                    selfdot='self.',
                    selfcomma='self, ',
                    doc=format_doc_string(el),
-                   handle=isinstance(node, ft.Type) and 'self._handle' or 'f90wrap.runtime.empty_handle')
+                   handle=isinstance(node, ft.Type) and 'self._handle' or 'f90wrap.runtime.empty_handle',
+                   owner=isinstance(node, ft.Type) and ',\n                        owner=self._owner' or '')
 
         if not isinstance(node, ft.Module) or not self.make_package:
             self.write('@property')
@@ -642,15 +796,32 @@ return %(el_name)s''' % dct)
             self.write('global %(el_name)s' % dct)
             node.array_initialisers.append(dct['el_name_get'])
 
-        self.write("""array_ndim, array_type, array_shape, array_handle = \
-    %(mod_name)s.%(prefix)s%(type_name)s__array__%(el_name)s(%(handle)s)
-if array_handle in %(selfdot)s_arrays:
-    %(el_name)s = %(selfdot)s_arrays[array_handle]
-else:
+        if not is_fixed_size_array(el, dims):
+            # data may move or change shape, so check the cached view
+            # against the Fortran array on every access
+            self.write("""%(el_name)s = f90wrap.runtime.get_array_cached(f90wrap.runtime.sizeof_fortran_t,
+                        %(handle)s,
+                        %(mod_name)s.%(prefix)s%(type_name)s__array__%(el_name)s,
+                        %(selfdot)s_arrays%(owner)s)
+return %(el_name)s""" % dct)
+        elif isinstance(node, ft.Type):
+            # fixed size arrays never move, so a cached view is always valid;
+            # views of all such elements are made together on first access
+            self.write("""try:
+    %(el_name)s = %(selfdot)s_arrays['%(el_name)s']
+except KeyError:
+    f90wrap.runtime.get_fixed_arrays(self)
+    %(el_name)s = %(selfdot)s_arrays['%(el_name)s']
+return %(el_name)s""" % dct)
+        else:
+            # fixed size arrays never move, so a cached view is always valid
+            self.write("""try:
+    %(el_name)s = %(selfdot)s_arrays['%(el_name)s']
+except KeyError:
     %(el_name)s = f90wrap.runtime.get_array(f90wrap.runtime.sizeof_fortran_t,
                             %(handle)s,
                             %(mod_name)s.%(prefix)s%(type_name)s__array__%(el_name)s)
-    %(selfdot)s_arrays[array_handle] = %(el_name)s
+    %(selfdot)s_arrays['%(el_name)s'] = %(el_name)s
 return %(el_name)s""" % dct)
         self.dedent()
         self.write()
@@ -699,11 +870,24 @@ return %(el_name)s""" % dct)
         self.indent()
         if isinstance(node, ft.Module) and self.make_package:
             self.write('global %(el_name)s' % dct)
+        fields = []
+        for field, gather_name, scatter_name in ft.bulk_access_routines(
+                node, el, self.types[ft.strip_type(el.type)], self.prefix):
+            if len(scatter_name) > ft.max_name_length:
+                continue  # not written by F90WrapperGenerator
+            fields.append("'%s': (%s.%s, %s.%s)" % (field.name, self.f90_mod_name, gather_name,
+                                                    self.f90_mod_name, scatter_name))
+        dct['fields'] = '{' + ', '.join(fields) + '}'
+        dct['address'] = 'None'
+        if (ft.record_elements(self.types[ft.strip_type(el.type)], self.kind_map) is not None and
+                'pointer' not in el.attributes):
+            dct['address'] = '%(f90_mod_name)s.%(prefix)s%(mod_name)s__array_address__%(el_name)s' % dct
         self.write('''%(selfdot)s%(el_name)s = f90wrap.runtime.FortranDerivedTypeArray(%(parent)s,
                                 %(f90_mod_name)s.%(prefix)s%(mod_name)s__array_getitem__%(el_name)s,
                                 %(f90_mod_name)s.%(prefix)s%(mod_name)s__array_setitem__%(el_name)s,
                                 %(f90_mod_name)s.%(prefix)s%(mod_name)s__array_len__%(el_name)s,
-                                %(doc)s, %(cls_mod_name)s%(cls_name)s)''' % dct)
+                                %(doc)s, %(cls_mod_name)s%(cls_name)s,
+                                fields=%(fields)s, addressfunc=%(address)s)''' % dct)
         self.write('return %(selfdot)s%(el_name)s' % dct)
         self.dedent()
         self.write()
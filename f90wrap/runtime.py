@@ -22,14 +22,26 @@ f90wrap.runtime
 Contains everything needed by f90wrap generated Python modules at runtime
 """
 
+import functools
+import numbers
+
+import numpy as np
+
 from f90wrap.fortrantype import (FortranDerivedType,
                                 FortranDerivedTypeArray,
-                                FortranModule)
-from f90wrap.arraydata import get_array
+                                FortranModule,
+                                FortranObjectCache,
+                                clear_caches,
+                                cache_info,
+                                set_cache_capacity)
+from f90wrap.arraydata import get_array, get_array_cached, get_arrays
+from f90wrap import parallel
 from f90wrap.sizeof_fortran_t import sizeof_fortran_t as _sizeof_fortran_t
+from f90wrap.six import string_types
 
 sizeof_fortran_t = _sizeof_fortran_t()
-empty_handle = [0]*sizeof_fortran_t
+# an array rather than a list, so f2py can pass it on without conversion
+empty_handle = np.zeros(sizeof_fortran_t, dtype=np.intc)
 empty_type = FortranDerivedType.from_handle(empty_handle)
 
 _f90wrap_classes = {}
@@ -48,3 +60,226 @@ class register_class(object):
 def lookup_class(cls_name):
     global _f90wrap_classes
     return _f90wrap_classes[cls_name]
+
+def batch(batch_func):
+    """
+    Decorator used by generated wrappers to attach `batch_func` to a
+    wrapped routine as its `batch` attribute. `batch_func` takes the same
+    arguments as the routine, stacked along an extra leading dimension,
+    and calls the routine for each item of the batch in a single Fortran
+    loop.
+    """
+    def decorate(func):
+        batch_func.__name__ = func.__name__ + '_batch'
+        batch_func.__doc__ = ('Call %s() for each item along the leading dimension '
+                              'of its arguments' % func.__name__)
+        func.batch = batch_func
+        return func
+    return decorate
+
+def _is_scalar(value):
+    """
+    Return True if `value` is a number or a zero-dimensional array, checking
+    the most common cases first, as this is done on every call to an
+    elemental routine
+    """
+    if isinstance(value, (float, int, numbers.Number, np.generic)):
+        return True
+    return np.ndim(value) == 0
+
+def elemental(elemental_func):
+    """
+    Decorator used by generated wrappers of elemental routines, so that
+    they can also be called with NumPy arrays, or anything convertible to
+    them, of any shape. If any argument is not a scalar, the arguments are
+    broadcast against one another and passed flattened to `elemental_func`,
+    which applies the routine to the whole arrays in a single Fortran call,
+    and the results are reshaped to the broadcast shape.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def broadcast(*args, **kwargs):
+            for arg in kwargs and args + tuple(kwargs.values()) or args:
+                if not _is_scalar(arg):
+                    break
+            else:
+                return func(*args, **kwargs)
+            names = list(kwargs.keys())
+            arrays = np.broadcast_arrays(*([np.asarray(arg) for arg in args] +
+                                           [np.asarray(kwargs[name]) for name in names]))
+            shape = arrays[0].shape
+            arrays = [array.ravel() for array in arrays]
+            results = elemental_func(*arrays[:len(args)],
+                                     **dict(zip(names, arrays[len(args):])))
+            if isinstance(results, tuple):
+                return tuple([result.reshape(shape) for result in results])
+            elif results is not None:
+                return results.reshape(shape)
+        return broadcast
+    return decorate
+
+def get_fixed_arrays(obj):
+    """
+    Make views of all the fixed size array elements of derived type instance
+    `obj`, listed in its class attribute `_fixed_arrays`, with a single call
+    into the arraydata extension, and store them in `obj._arrays`
+    """
+    names, funcs = obj._fixed_arrays
+    for name, array in zip(names, get_arrays(sizeof_fortran_t, obj._handle, funcs,
+                                             owner=obj._owner)):
+        if array is not None:
+            obj._arrays[name] = array
+
+
+# order in which numerical kinds can be safely converted to one another
+_numeric_kinds = 'bifc'
+
+def _arg_key(value):
+    """
+    Cheap description of the type of an argument, used as part of the key
+    of an overload dispatch table
+    """
+    if isinstance(value, np.ndarray):
+        return (value.dtype.char, value.ndim)
+    return type(value)
+
+def _value_kind(value):
+    """
+    Return a tuple (kind, rank, dtype) describing `value`, where kind is one
+    of 'b', 'i', 'f', 'c', 'S' like a numpy dtype kind, or None if `value` is
+    not a scalar, string or numpy array.
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        kind = value.dtype.kind
+        if kind == 'u':
+            kind = 'i'
+        elif kind == 'U':
+            kind = 'S'
+        return kind, value.ndim, value.dtype.char
+    if isinstance(value, bool):
+        return 'b', 0, None
+    if isinstance(value, numbers.Integral):
+        return 'i', 0, None
+    if isinstance(value, numbers.Real):
+        return 'f', 0, None
+    if isinstance(value, numbers.Complex):
+        return 'c', 0, None
+    if isinstance(value, string_types) or isinstance(value, bytes):
+        return 'S', 0, None
+    return None, None, None
+
+def _match_score(spec, value):
+    """
+    Score how well `value` matches argument specification `spec`:
+    3 for an exact match, 2 for a subclass or a different precision of the
+    same kind, 1 for a value which can be safely converted, and None if
+    the value cannot be passed as this argument.
+    """
+    name, kind, rank, dtype, optional = spec
+    if value is None:
+        return optional and 1 or None
+    if kind == 'type':
+        cls = lookup_class(dtype)
+        if type(value) is cls:
+            return 3
+        return isinstance(value, cls) and 2 or None
+    if kind == 'callback':
+        return callable(value) and 3 or None
+    value_kind, value_rank, value_dtype = _value_kind(value)
+    if value_kind is None or value_rank != rank:
+        return None
+    if value_kind == kind:
+        return (dtype is None or value_dtype == dtype) and 3 or 2
+    if (value_kind in _numeric_kinds and kind in _numeric_kinds and
+            _numeric_kinds.index(value_kind) < _numeric_kinds.index(kind)):
+        return 1
+    return None
+
+def _signature_score(signature, args, kwargs):
+    """
+    Total score of the match between `args` and `kwargs` and the argument
+    specifications in `signature`, or None if they are not compatible.
+    """
+    if len(args) > len(signature):
+        return None
+    score = 0
+    for spec, value in zip(signature, args):
+        arg_score = _match_score(spec, value)
+        if arg_score is None:
+            return None
+        score += arg_score
+    names = [spec[0] for spec in signature[len(args):]]
+    for key in kwargs:
+        if key not in names:
+            return None
+    for spec in signature[len(args):]:
+        if spec[0] in kwargs:
+            arg_score = _match_score(spec, kwargs[spec[0]])
+            if arg_score is None:
+                return None
+            score += arg_score
+        elif not spec[4]:
+            return None  # missing mandatory argument
+    return score
+
+class overload(object):
+    """
+    Decorator used by generated wrappers to dispatch calls to an overloaded
+    Fortran interface to one of its specific procedures.
+
+    The decorated function should return the list of specific procedures,
+    and `signatures` should give, for each of them, a list of tuples
+    ``(name, kind, rank, dtype, optional)`` describing their arguments.
+    `kind` is one of 'b', 'i', 'f', 'c' or 'S' for logical, integer, real,
+    complex and character arguments, 'callback', or 'type' for derived
+    types, in which case `dtype` is the name of the Python class.
+
+    The specific procedure best matching the kinds, ranks and dtypes of
+    the arguments is chosen on the first call with each combination of
+    argument types, and looked up in a dispatch table on later calls.
+    If no specific procedure matches and some arguments are lists or
+    tuples, which f2py converts to arrays, each procedure is tried in turn
+    until one does not raise a `TypeError` or `ValueError`, as f2py does
+    when it cannot convert an argument. Otherwise `TypeError` is raised.
+    """
+
+    def __init__(self, signatures):
+        self.signatures = signatures
+
+    def __call__(self, find_procedures):
+        signatures = self.signatures
+        procedures = []
+        table = {}
+
+        @functools.wraps(find_procedures)
+        def dispatch(*args, **kwargs):
+            key = tuple([_arg_key(arg) for arg in args])
+            if kwargs:
+                key += tuple(sorted([(name, _arg_key(arg)) for (name, arg) in kwargs.items()]))
+            try:
+                proc = table[key]
+            except KeyError:
+                if not procedures:
+                    procedures.extend(find_procedures())
+                proc = None
+                best_score = None
+                for candidate, signature in zip(procedures, signatures):
+                    score = _signature_score(signature, args, kwargs)
+                    if score is not None and (best_score is None or score > best_score):
+                        proc, best_score = candidate, score
+                if proc is None:
+                    values = list(args) + list(kwargs.values())
+                    if not any([isinstance(value, (list, tuple)) for value in values]):
+                        raise TypeError('no overloaded procedure in %s matches the arguments given'
+                                        % find_procedures.__name__)
+                    for proc in procedures:
+                        try:
+                            return proc(*args, **kwargs)
+                        except (TypeError, ValueError):
+                            continue
+                    raise TypeError('no overloaded procedure in %s matches the arguments given'
+                                    % find_procedures.__name__)
+                table[key] = proc
+            return proc(*args, **kwargs)
+
+        return dispatch
@@ -1119,14 +1119,14 @@ def find_referenced_modules(mods, tree):
     all_mods : set
         Module() objects which are recursively used by the given modules.
     """
+    index = ft.SymbolIndex(tree)
     new_mods = copy.copy(mods)
     while new_mods != set():
         temp = list(new_mods)
         for m in temp:
             for m2 in m.uses:
-                for m3 in ft.walk_modules(tree):
-                    if m3.name == m2:
-                        new_mods.add(m3)
+                for m3 in index.modules.get(m2, []):
+                    new_mods.add(m3)
         new_mods -= mods
         mods |= new_mods
 
@@ -1153,6 +1153,8 @@ def find_referenced_types(mods, tree):
                  modules given, or recursively referenced by those types.
     """
 
+    index = ft.SymbolIndex(tree)
+
     # Get used types now
     kept_types = set()
     for mod in mods:
@@ -1161,10 +1163,8 @@ def find_referenced_types(mods, tree):
 
         for el in mod.elements:
             if el.type.startswith('type'):
-                for mod2 in ft.walk_modules(tree):
-                    for mt in mod2.types:
-                        if mt.name in el.type:
-                            kept_types.add(mt)
+                for mt in index.types.get(ft.strip_type(el.type), []):
+                    kept_types.add(mt)
 
     # kept_types is now all types defined/referenced directly in kept_mods. But we also
     # need those referenced by them.
@@ -1174,10 +1174,8 @@ def find_referenced_types(mods, tree):
         for t in temp_set:
             for el in t.elements:
                 if el.type.startswith('type'):  # a referenced type, need to find def
-                    for mod2 in ft.walk_modules(tree):
-                        for mt in mod2.types:
-                            if mt.name in el.type:
-                                new_set.add(mt)
+                    for mt in index.types.get(ft.strip_type(el.type), []):
+                        new_set.add(mt)
         # take out all the original types from new_set
         new_set -= kept_types
         # update the kept_types with new ones
@@ -1194,9 +1192,11 @@ def create_super_types(tree, types):
     # the type is declared in the first place.
     modules_indexes = dict(
         (mod.name, i) for (i, mod) in enumerate(tree.modules))  # name to index map, compatible python 2.6
+    index = ft.SymbolIndex(tree)
     containers = []
     for ty in types.values():
-        for dimensions_attribute in ty.super_types_dimensions:
+        # sorted, so that super-types are always created in the same order
+        for dimensions_attribute in sorted(ty.super_types_dimensions):
             # each type might have many "dimension" attributes since "append_type_dimension"
             dimensions = ArrayDimensionConverter.split_dimensions(dimensions_attribute)
             if len(dimensions) == 1:  # at this point, only 1D arrays are supported
@@ -1216,7 +1216,7 @@ def create_super_types(tree, types):
                     # super_type.uses = ty.uses  # this causes unwanted growth of the normal type "uses" when we add parameters to the super-type in the next step
                     super_type.uses = set([(ty.mod_name, (ty.name,))])
                     # uses clause if the dimension is a parameter (which is handled through a n=shape(array) hidden argument in the case of regular arrays)
-                    param = extract_dimensions_parameters(d, tree)
+                    param = extract_dimensions_parameters(d, tree, index)
                     if param:
                         super_type.uses.add((param[0], (param[1],)))
 
@@ -1240,6 +1240,7 @@ def append_type_dimension(tree, types):
 def fix_subroutine_type_arrays(tree, types):
     # YANN: replace dimension(x) :: type() arguments of routines by scalar super-types
     from itertools import chain
+    index = ft.SymbolIndex(tree)
     # For each top-level procedure and module procedures:
     for proc in chain(tree.procedures, *(mod.procedures for mod in tree.modules)):
         for arg in proc.arguments:
@@ -1253,7 +1254,7 @@ def fix_subroutine_type_arrays(tree, types):
                 # change the type to super-type
                 arg.type = arg.type[:-1] + '_x' + str(d) + '_array)'
                 # if the dimension is a parameter somewhere, add it to the uses clauses
-                param = extract_dimensions_parameters(d, tree)
+                param = extract_dimensions_parameters(d, tree, index)
                 if param:
                     proc.uses.add((param[0], (param[1],)))
                 # ... then remove the dimension, since we now use a scalar super-type ...
@@ -1262,11 +1263,14 @@ def fix_subroutine_type_arrays(tree, types):
                 arg.doc.append('super-type')
 
 
-def extract_dimensions_parameters(d, tree):
+def extract_dimensions_parameters(d, tree, index=None):
     # YANN: returns (module, parameter) if there is a parameter matching the dimension
+    # `index` is an optional ft.SymbolIndex of the tree, to avoid building one per call
     if not d.isdigit():
         # then: look for the dimension in the parameters
-        for mod in tree.modules:
-            for el in mod.elements:
-                if d == el.name and "parameter" in el.attributes:
-                    return (mod.name, el.name)
+        if index is None:
+            index = ft.SymbolIndex(tree)
+        param = index.find_parameter(d)
+        if param is not None:
+            mod, el = param
+            return (mod.name, el.name)
@@ -33,10 +33,12 @@ from argparse import RawDescriptionHelpFormatter
 
 from f90wrap import __version__
 
+from f90wrap import codegen as cg
 from f90wrap import parser as fparse
 from f90wrap import fortran
 from f90wrap.sizeof_fortran_t import sizeof_fortran_t
 from f90wrap import transform as tf
+from f90wrap import incremental as incr
 
 from f90wrap import f90wrapgen as fwrap
 from f90wrap import pywrapgen as pywrap
@@ -134,6 +136,15 @@ USAGE
         parser.add_argument('-r', '--rule', nargs="*", 
                             help="""Files containing rules for defining structures be public or private""")
         parser.add_argument("--conf-file", help="Use Python configuration script to set options")
+        parser.add_argument('-j', '--jobs', default=1, type=int,
+                            help="""Number of processes to use when parsing source files""")
+        parser.add_argument('--cache-dir',
+                            help="""Directory in which to cache parse trees of unchanged source files""")
+        parser.add_argument('--incremental', action='store_true',
+                            help="""Only regenerate wrapper files affected by changes since the last run""")
+        parser.add_argument('-b', '--batch', nargs="*", default=[],
+                            help="""Names of routines to also wrap as routine.batch(), which calls the routine
+                            for each item along the leading dimension of its arguments in a single Fortran loop""")
 
         args = parser.parse_args()
 
@@ -193,9 +204,7 @@ USAGE
 
         print('Kind map (also saved to .f2py_f2cmap)')
         pprint.pprint(kind_map)
-        f2py_f2cmap = open('.f2py_f2cmap', 'w')
-        pprint.pprint(kind_map, f2py_f2cmap)
-        f2py_f2cmap.close()
+        cg.write_if_changed('.f2py_f2cmap', pprint.pformat(kind_map) + '\n')
         print()
 
         print('Constructors:')
@@ -238,11 +247,11 @@ USAGE
         files_not_found = [file for file in args.files if not os.path.exists(file)]
         if len(files_not_found) != 0:
             raise Exception("source file '%s' not exist" % (','.join(files_not_found)))
-        parse_tree = fparse.read_files(args.files)
+        tree = fparse.read_files(args.files, jobs=args.jobs,
+                                 cache_dir=args.cache_dir)
         print('done parsing source.')
         print()
-        tree = copy.deepcopy(parse_tree)
-        
+
         if rule and len(rule) != 0:
             files_not_found = [file for file in rule if not os.path.exists(file)]
             if len(files_not_found) != 0:
@@ -279,10 +288,41 @@ USAGE
                                                modules_for_type,
                                                remove_optional_arguments)
 
-        py_tree = copy.deepcopy(tree)
+        # signatures are computed after the generic transformations, which
+        # can move procedures into the wrappers of types in other modules
+        signatures = None
+        if args.incremental:
+            # everything apart from the source files which affects the generated code
+            options = dict(prefix=prefix, mod_name=mod_name, package=package,
+                           kind_map=kind_map, constructors=constructors,
+                           destructors=destructors, short_names=short_names,
+                           string_lengths=string_lengths,
+                           default_string_length=default_string_length,
+                           init_lines=init_lines, py_mod_names=py_mod_names,
+                           class_names=class_names,
+                           argument_name_map=argument_name_map,
+                           joint_modules=joint_modules, callback=callback,
+                           remove_optional_arguments=remove_optional_arguments,
+                           move_methods=move_methods,
+                           shorten_routine_names=shorten_routine_names,
+                           abort_func=abort_func,
+                           default_to_inout=default_to_inout,
+                           batch=batch,
+                           sizeof_fortran_t=fsize)
+            for filename in [args.init_file] + (rule or []):
+                if filename is not None:
+                    options[filename] = open(filename).read()
+            signatures = incr.module_signatures(tree, types,
+                                                pprint.pformat(options),
+                                                joint_modules)
+
+        # The Fortran wrapper is generated from a copy of the tree, while the
+        # Python-specific transformations are applied to the tree in place.
+        # The latter only modify procedures and their arguments, and leave
+        # the derived types in `types` as the Fortran wrapper generator
+        # expects them.
         f90_tree = copy.deepcopy(tree)
-
-        py_tree = tf.transform_to_py_wrapper(py_tree, types)
+        py_tree = tf.transform_to_py_wrapper(tree, types)
 
         f90_tree = tf.transform_to_f90_wrapper(f90_tree, types,
                                                callback,
@@ -301,10 +341,14 @@ USAGE
                                       init_file=args.init_file,
                                       py_mod_names=py_mod_names,
                                       class_names=class_names,
-                                      dest = pydest).visit(py_tree)
+                                      dest = pydest,
+                                      signatures=signatures,
+                                      batch=batch).visit(py_tree)
         fwrap.F90WrapperGenerator(prefix, fsize, string_lengths,
                                   abort_func, kind_map, types, default_to_inout,
-                                  dest = fdest).visit(f90_tree)
+                                  dest = fdest,
+                                  signatures=signatures,
+                                  batch=batch).visit(f90_tree)
         return 0
 
     except KeyboardInterrupt: